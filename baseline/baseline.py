@@ -41,7 +41,21 @@ from rubin_scheduler.scheduler.surveys import (
 from rubin_scheduler.scheduler.targetofo import gen_all_events
 from rubin_scheduler.scheduler.utils import ConstantFootprint, CurrentAreaMap, make_rolling_footprints
 from rubin_scheduler.site_models import Almanac
-from rubin_scheduler.utils import DEFAULT_NSIDE, SURVEY_START_MJD, _hpid2_ra_dec
+from rubin_scheduler.utils import DEFAULT_NSIDE, SURVEY_START_MJD, SysEngVals, _hpid2_ra_dec
+
+from obs_io import (
+    add_columns_db,
+    encode_notes_db,
+    index_observations_db,
+    sky_counts,
+    write_parquet,
+)
+from ddf_cache import load_ddf_obs
+from fast_scheduler import FastCoreScheduler
+from night_context import NightCachedAlmanac
+from rot_stats import RotatorDeltaHistograms
+from scheduled_index import TimeToNextScheduledBasisFunction
+from too_cache import load_too_events
 
 # So things don't fail on hyak
 iers.conf.auto_download = False
@@ -50,7 +64,10 @@ iers.conf.auto_max_age = None
 
 
 def example_scheduler(
-    nside: int = DEFAULT_NSIDE, mjd_start: float = SURVEY_START_MJD, no_too: bool = False
+    nside: int = DEFAULT_NSIDE,
+    mjd_start: float = SURVEY_START_MJD,
+    no_too: bool = False,
+    too_cache_dir: str | None = None,
 ) -> CoreScheduler:
     """Provide an example baseline survey-strategy scheduler.
 
@@ -62,6 +79,9 @@ def example_scheduler(
         Start date for the survey (MJD).
     no_too : `bool`
         Turn off ToO simulation. Default False.
+    too_cache_dir : `str`
+        Directory to cache the simulated ToO events in, rather
+        than generating them on every call. Default None.
 
     Returns
     -------
@@ -72,6 +92,7 @@ def example_scheduler(
     args = parser.parse_args(args=[])
     args.setup_only = True
     args.no_too = no_too
+    args.too_cache_dir = too_cache_dir
     args.dbroot = "example_"
     args.outDir = "."
     args.nside = nside
@@ -448,7 +469,7 @@ def blob_for_long(
         )
 
         # Make sure we respect scheduled observations
-        bfs.append((bf.TimeToScheduledBasisFunction(time_needed=scheduled_respect), 0))
+        bfs.append((TimeToNextScheduledBasisFunction(time_needed=scheduled_respect), 0))
 
         # Masks, give these 0 weight
         bfs.append(
@@ -937,7 +958,7 @@ def generate_blobs(
                     )
                 )
         # Make sure we respect scheduled observations
-        bfs.append((bf.TimeToScheduledBasisFunction(time_needed=scheduled_respect), 0))
+        bfs.append((TimeToNextScheduledBasisFunction(time_needed=scheduled_respect), 0))
         # Masks, give these 0 weight
         bfs.append(
             (
@@ -1156,7 +1177,7 @@ def generate_twi_blobs(
                 )
             )
         # Make sure we respect scheduled observations
-        bfs.append((bf.TimeToScheduledBasisFunction(time_needed=scheduled_respect), 0))
+        bfs.append((TimeToNextScheduledBasisFunction(time_needed=scheduled_respect), 0))
         # Masks, give these 0 weight
         bfs.append(
             (
@@ -1214,6 +1235,8 @@ def ddf_surveys(
     nside=None,
     expt=29.2,
     nexp=2,
+    mjd_start=SURVEY_START_MJD,
+    cache_dir=None,
 ):
     """Generate surveys for DDF observations
 
@@ -1229,17 +1252,30 @@ def ddf_surveys(
         Default None.
     expt : `float`
         Exposure time for DDF visits. Default 29.2.
+    mjd_start : `float`
+        Start of the survey (MJD). Default SURVEY_START_MJD.
+    cache_dir : `str`
+        Directory to cache the DDF scheduled observations in, rather
+        than planning them on every call. Default None.
     """
     nsnaps = [1, 2, 2, 2, 2, 2]
     if nexp == 1:
         nsnaps = [1, 1, 1, 1, 1, 1]
-    obs_array = generate_ddf_scheduled_obs(season_unobs_frac=season_unobs_frac, expt=expt, nsnaps=nsnaps)
-    euclid_obs = np.where(
-        (obs_array["scheduler_note"] == "DD:EDFS_b") | (obs_array["scheduler_note"] == "DD:EDFS_a")
-    )[0]
-    all_other = np.where(
-        (obs_array["scheduler_note"] != "DD:EDFS_b") & (obs_array["scheduler_note"] != "DD:EDFS_a")
-    )[0]
+    if cache_dir is None:
+        obs_array = generate_ddf_scheduled_obs(
+            season_unobs_frac=season_unobs_frac, expt=expt, nsnaps=nsnaps, mjd_start=mjd_start
+        )
+    else:
+        obs_array = load_ddf_obs(
+            mjd_start=mjd_start,
+            season_unobs_frac=season_unobs_frac,
+            expt=expt,
+            nsnaps=nsnaps,
+            cache_dir=cache_dir,
+        )
+    is_euclid = np.isin(obs_array["scheduler_note"], ["DD:EDFS_a", "DD:EDFS_b"])
+    euclid_obs = np.where(is_euclid)[0]
+    all_other = np.where(~is_euclid)[0]
 
     survey1 = ScriptedSurvey([bf.AvoidDirectWind(nside=nside)], nside=nside, detailers=detailers)
     survey1.set_script(obs_array[all_other])
@@ -1508,11 +1544,35 @@ def run_sched(
     mjd_start=60796.0,
     event_table=None,
     sim_to_o=None,
+    parquet=False,
+    sky_count_limit=None,
+    rot_stats=False,
+    encode_notes=False,
+    night_cache=False,
 ):
-    """Run survey"""
+    """Run survey
+
+    If parquet is True, the observations are also written to a parquet
+    file next to the sqlite database (one row group per night).
+
+    If sky_count_limit is set, the sky counts per pixel in each exposure
+    are added to the output as skyCounts, with skySaturated flagging
+    visits over the limit.
+
+    If rot_stats is True, histograms of rotator moves within each
+    scheduler_note are printed and saved next to the database.
+
+    If encode_notes is True, scheduler_note and target_name are stored
+    as integer codes in the database, see `obs_io.encode_notes_db`.
+
+    If night_cache is True, quantities fixed for a night are computed
+    once per night, see `night_context.NightCachedAlmanac`.
+    """
     n_visit_limit = None
     fs = SimpleFilterSched(illum_limit=illum_limit)
     observatory = ModelObservatory(nside=nside, mjd_start=mjd_start, sim_to_o=sim_to_o)
+    if night_cache:
+        observatory.almanac = NightCachedAlmanac(observatory.almanac)
     observatory, scheduler, observations = sim_runner(
         observatory,
         scheduler,
@@ -1526,6 +1586,45 @@ def run_sched(
         event_table=event_table,
     )
 
+    extra_columns = None
+    if sky_count_limit is not None:
+        # Computed from the in-memory observations, no need to re-read the db
+        counts = sky_counts(
+            observations["skybrightness"],
+            observations["exptime"] / observations["nexp"],
+            observations["filter"],
+            SysEngVals().zp_t,
+        )
+        extra_columns = {"skyCounts": counts, "skySaturated": counts > sky_count_limit}
+        print("%i visits over %.0f sky counts" % (np.sum(counts > sky_count_limit), sky_count_limit))
+
+    if filename is not None:
+        index_observations_db(filename)
+        if extra_columns is not None:
+            add_columns_db(filename, observations["ID"], extra_columns)
+        if encode_notes:
+            encode_notes_db(filename)
+    if parquet and filename is not None:
+        write_parquet(
+            observations, filename.replace(".db", ".parquet"), info=extra_info, extra_columns=extra_columns
+        )
+
+    if hasattr(sim_to_o, "memory_report"):
+        print(sim_to_o.memory_report())
+    if hasattr(scheduler, "timing_report"):
+        print(scheduler.timing_report())
+    if hasattr(observatory.almanac, "report"):
+        print(observatory.almanac.report())
+
+    if rot_stats:
+        rot_hists = RotatorDeltaHistograms()
+        rot_hists.add_observations(
+            np.degrees(observations["rotTelPos"]), observations["filter"], observations["scheduler_note"]
+        )
+        print(rot_hists.summary())
+        if filename is not None:
+            rot_hists.save(filename.replace(".db", "_rot_hist.npz"))
+
     return observatory, scheduler, observations
 
 
@@ -1560,7 +1659,7 @@ def gen_scheduler(args):
     camera_ddf_rot_limit = 75.0  # degrees
 
     # Be sure to also update and regenerate DDF grid save file
-    # if changing mjd_start
+    # if changing mjd_start (--ddf_cache_dir caches per mjd_start)
     mjd_start = SURVEY_START_MJD + mjd_plus
 
     fileroot, extra_info = set_run_info(dbroot=dbroot, file_end="v4.1_", out_dir=out_dir)
@@ -1644,6 +1743,8 @@ def gen_scheduler(args):
         euclid_detailers=euclid_detailers,
         nside=nside,
         nexp=nexp,
+        mjd_start=mjd_start,
+        cache_dir=args.ddf_cache_dir,
     )
 
     greedy = gen_greedy_surveys(nside, nexp=nexp, footprints=footprints)
@@ -1679,7 +1780,10 @@ def gen_scheduler(args):
     ]
     if too:
         too_scale = 1.0
-        sim_ToOs, event_table = gen_all_events(scale=too_scale, nside=nside)
+        if args.too_cache_dir is None:
+            sim_ToOs, event_table = gen_all_events(scale=too_scale, nside=nside)
+        else:
+            sim_ToOs, event_table = load_too_events(scale=too_scale, nside=nside, cache_dir=args.too_cache_dir)
         camera_rot_limits = [-80.0, 80.0]
         detailer_list = []
         detailer_list.append(
@@ -1706,7 +1810,10 @@ def gen_scheduler(args):
         event_table = None
         fileroot = fileroot.replace("baseline", "no_too")
 
-    scheduler = CoreScheduler(surveys, nside=nside)
+    if args.fast_scheduler:
+        scheduler = FastCoreScheduler(surveys, nside=nside)
+    else:
+        scheduler = CoreScheduler(surveys, nside=nside)
 
     if args.setup_only:
         return scheduler
@@ -1723,6 +1830,11 @@ def gen_scheduler(args):
             mjd_start=mjd_start,
             event_table=event_table,
             sim_to_o=sim_ToOs,
+            parquet=args.parquet,
+            sky_count_limit=args.sky_count_limit,
+            rot_stats=args.rot_stats,
+            encode_notes=args.encode_notes,
+            night_cache=args.night_cache,
         )
         return observatory, scheduler, observations
 
@@ -1763,6 +1875,59 @@ def sched_argparser():
     parser.set_defaults(split_long=False)
     parser.add_argument("--no_too", dest="no_too", action="store_true")
     parser.set_defaults(no_too=False)
+    parser.add_argument(
+        "--too_cache_dir",
+        type=str,
+        default=None,
+        help="Cache the simulated ToO events in this directory instead of regenerating them each run",
+    )
+    parser.add_argument(
+        "--ddf_cache_dir",
+        type=str,
+        default=None,
+        help="Cache the DDF scheduled observations (per mjd_start) in this directory instead of replanning them",
+    )
+    parser.add_argument(
+        "--parquet",
+        dest="parquet",
+        action="store_true",
+        help="Also write observations to a parquet file with a row group per night",
+    )
+    parser.set_defaults(parquet=False)
+    parser.add_argument(
+        "--sky_count_limit",
+        type=float,
+        default=None,
+        help="Record sky counts per exposure and flag visits over this many counts (e.g., 30000)",
+    )
+    parser.add_argument(
+        "--rot_stats",
+        dest="rot_stats",
+        action="store_true",
+        help="Report histograms of rotator moves within each scheduler_note at the end of the run",
+    )
+    parser.set_defaults(rot_stats=False)
+    parser.add_argument(
+        "--encode_notes",
+        dest="encode_notes",
+        action="store_true",
+        help="Store scheduler_note and target_name as integer codes (observations becomes a decoding view)",
+    )
+    parser.set_defaults(encode_notes=False)
+    parser.add_argument(
+        "--fast_scheduler",
+        dest="fast_scheduler",
+        action="store_true",
+        help="Skip the ToO tier when no event or follow-up is pending, and report per-tier timing",
+    )
+    parser.set_defaults(fast_scheduler=False)
+    parser.add_argument(
+        "--night_cache",
+        dest="night_cache",
+        action="store_true",
+        help="Compute start-of-night almanac quantities once per night rather than on every visit",
+    )
+    parser.set_defaults(night_cache=False)
 
     return parser
 
@@ -0,0 +1,232 @@
+# Cache the DDF scheduled observations on disk, so runs (e.g., --mjd_plus
+# sweeps) don't each redo the DDF planning, and plan the fields in
+# parallel when the cache needs (re)generating.
+
+__all__ = ("DDF_NAMES", "ddf_cache_file", "generate_ddf_obs", "load_ddf_obs")
+
+import multiprocessing
+import os
+import warnings
+
+import numpy as np
+
+import rubin_scheduler
+from rubin_scheduler.data import get_data_dir
+from rubin_scheduler.scheduler.surveys.ddf_presched import optimize_ddf_times
+from rubin_scheduler.scheduler.utils import ScheduledObservationArray
+from rubin_scheduler.utils import SURVEY_START_MJD, ddf_locations
+
+from obs_io import atomic_save
+
+# In the order generate_ddf_scheduled_obs plans them.
+# EDFS_a also schedules EDFS_b.
+DDF_NAMES = ["ELAISS1", "XMM_LSS", "ECDFS", "COSMOS", "EDFS_a"]
+
+# Holds the DDF grid for forked workers
+_SHARED = {}
+
+
+def ddf_cache_file(mjd_start, season_unobs_frac=0.2, expt=29.2, nsnaps=[1, 2, 2, 2, 2, 2], cache_dir="."):
+    """Filename of the cached DDF scheduled observations"""
+    name = "ddf_obs_mjd%.4f_unobs%g_expt%g_nsnaps%s_rs%s.npy" % (
+        mjd_start,
+        season_unobs_frac,
+        expt,
+        "".join(["%i" % nexp for nexp in nsnaps]),
+        rubin_scheduler.__version__,
+    )
+    return os.path.join(cache_dir, name)
+
+
+def _field_times(ddf_name, season_unobs_frac, sequence_time, low_season_frac, low_season_rate):
+    """Planned sequence times for one DDF (run in a worker)"""
+    print("Optimizing %s" % ddf_name)
+    mjds = optimize_ddf_times(
+        ddf_name,
+        ddf_locations()[ddf_name][0],
+        _SHARED["ddf_grid"],
+        season_unobs_frac=season_unobs_frac,
+        sequence_time=sequence_time,
+        low_season_frac=low_season_frac,
+        low_season_rate=low_season_rate,
+    )[0]
+    return np.array(mjds, dtype=float)
+
+
+def _field_obs(ddf_name, mjds, nvis_master, filters, nsnaps):
+    """Observations for every sequence of one DDF, in one go
+
+    Rows come out in the same order as the loops of
+    generate_ddf_scheduled_obs: by sequence, then filter (then
+    EDFS_a before EDFS_b).
+    """
+    nvis_master = np.array(nvis_master)
+    filters = np.array(list(filters))
+    nsnaps = np.array(nsnaps)
+    if "EDFS" in ddf_name:
+        names = np.array([ddf_name, ddf_name.replace("_a", "_b")])
+        # Half the visits to each of EDFS_a and EDFS_b
+        per_filter = np.repeat(nvis_master // 2, 2)
+        filter_indx = np.repeat(np.repeat(np.arange(filters.size), 2), per_filter)
+        name_indx = np.repeat(np.tile([0, 1], filters.size), per_filter)
+    else:
+        names = np.array([ddf_name])
+        filter_indx = np.repeat(np.arange(filters.size), nvis_master)
+        name_indx = np.zeros(filter_indx.size, dtype=int)
+
+    n_seq = np.size(mjds)
+    filter_indx = np.tile(filter_indx, n_seq)
+    name_indx = np.tile(name_indx, n_seq)
+    ddfs = ddf_locations()
+    obs = ScheduledObservationArray(n=filter_indx.size)
+    obs["RA"] = np.radians([ddfs[name][0] for name in names])[name_indx]
+    obs["dec"] = np.radians([ddfs[name][1] for name in names])[name_indx]
+    obs["mjd"] = np.repeat(mjds, filter_indx.size // max(n_seq, 1))
+    obs["filter"] = filters[filter_indx]
+    obs["nexp"] = nsnaps[filter_indx]
+    notes = np.array(["DD:%s" % name for name in names])[name_indx]
+    obs["scheduler_note"] = notes
+    obs["target_name"] = notes
+    # generate_ddf_scheduled_obs leaves these unset for EDFS_a
+    tagged = np.where(names[name_indx] != "EDFS_a")[0]
+    obs["science_program"][tagged] = "DD"
+    obs["observation_reason"][tagged] = "FBS"
+    return obs, tagged
+
+
+def generate_ddf_obs(
+    mjd_start=SURVEY_START_MJD,
+    season_unobs_frac=0.2,
+    expt=29.2,
+    nsnaps=[1, 2, 2, 2, 2, 2],
+    n_proc=None,
+    data_file=None,
+    flush_length=2,
+    mjd_tol=15,
+    alt_min=25,
+    alt_max=85,
+    HA_min=21.0,
+    HA_max=3.0,
+    sun_alt_max=-18,
+    moon_min_distance=25.0,
+    dist_tol=3.0,
+    nvis_master=[8, 10, 20, 20, 24, 18],
+    filters="ugrizy",
+    survey_length=10.0,
+    sequence_time=60.0,
+    low_season_frac=0,
+    low_season_rate=0.3,
+):
+    """Same output as `generate_ddf_scheduled_obs`, fields planned in parallel
+
+    Parameters
+    ----------
+    n_proc : `int`
+        Number of processes to plan the DDFs with. Default None
+        uses one per DDF (up to the number of CPUs).
+
+    See `rubin_scheduler.scheduler.surveys.generate_ddf_scheduled_obs`
+    for the other parameters.
+
+    Returns
+    -------
+    obs : `rubin_scheduler.scheduler.utils.ScheduledObservationArray`
+    """
+    if data_file is None:
+        data_file = os.path.join(get_data_dir(), "scheduler", "ddf_grid.npz")
+    if n_proc is None:
+        n_proc = min(len(DDF_NAMES), os.cpu_count())
+
+    ddf_grid = np.load(data_file)["ddf_grid"]
+    mjd_max = mjd_start + survey_length * 365.25
+    if (ddf_grid["mjd"].min() > mjd_start) | (ddf_grid["mjd"].max() < mjd_max):
+        warnings.warn("Pre-computed DDF properties don't match requested survey times")
+    in_range = np.where((ddf_grid["mjd"] >= mjd_start) & (ddf_grid["mjd"] <= mjd_max))
+    _SHARED["ddf_grid"] = ddf_grid[in_range]
+
+    field_args = [
+        (ddf_name, season_unobs_frac, sequence_time, low_season_frac, low_season_rate) for ddf_name in DDF_NAMES
+    ]
+    if n_proc > 1:
+        # fork, so the workers share the grid rather than pickling it
+        with multiprocessing.get_context("fork").Pool(n_proc) as pool:
+            field_mjds = pool.starmap(_field_times, field_args)
+    else:
+        field_mjds = [_field_times(*arg) for arg in field_args]
+    del _SHARED["ddf_grid"]
+
+    all_obs = []
+    all_tagged = []
+    n_before = 0
+    for ddf_name, mjds in zip(DDF_NAMES, field_mjds):
+        obs, tagged = _field_obs(ddf_name, mjds, nvis_master, filters, nsnaps)
+        all_obs.append(obs)
+        all_tagged.append(tagged + n_before)
+        n_before += obs.size
+    result = np.concatenate(all_obs).view(ScheduledObservationArray)
+
+    result["flush_by_mjd"] = result["mjd"] + flush_length
+    result["exptime"] = expt
+    result["mjd_tol"] = mjd_tol / 60 / 24.0
+    result["dist_tol"] = np.radians(dist_tol)
+    result["HA_min"] = HA_min
+    result["HA_max"] = HA_max
+    result["alt_min"] = np.radians(alt_min)
+    result["alt_max"] = np.radians(alt_max)
+    result["sun_alt_max"] = np.radians(sun_alt_max)
+    # Also left unset for EDFS_a
+    result["moon_min_distance"][np.concatenate(all_tagged)] = np.radians(moon_min_distance)
+    return result
+
+
+def load_ddf_obs(
+    mjd_start=SURVEY_START_MJD,
+    season_unobs_frac=0.2,
+    expt=29.2,
+    nsnaps=[1, 2, 2, 2, 2, 2],
+    cache_dir=".",
+    n_proc=None,
+):
+    """Cached equivalent of `generate_ddf_scheduled_obs`
+
+    The cache is regenerated if it is missing or older than the DDF
+    grid data file.
+
+    Parameters
+    ----------
+    mjd_start : `float`
+        Start of the survey (MJD). Default SURVEY_START_MJD.
+    season_unobs_frac : `float`
+        Fraction of the season to not attempt DDF observations.
+        Default 0.2.
+    expt : `float`
+        Exposure time for DDF visits. Default 29.2.
+    nsnaps : `list` [`int`]
+        Number of snaps per filter. Default [1, 2, 2, 2, 2, 2].
+    cache_dir : `str`
+        Directory holding the cached observations. Default ".".
+    n_proc : `int`
+        Number of processes to use if generating. Default None.
+
+    Returns
+    -------
+    obs : `rubin_scheduler.scheduler.utils.ScheduledObservationArray`
+    """
+    filename = ddf_cache_file(
+        mjd_start, season_unobs_frac=season_unobs_frac, expt=expt, nsnaps=nsnaps, cache_dir=cache_dir
+    )
+    data_file = os.path.join(get_data_dir(), "scheduler", "ddf_grid.npz")
+    if os.path.isfile(filename) and os.path.getmtime(filename) >= os.path.getmtime(data_file):
+        return np.load(filename).view(ScheduledObservationArray)
+
+    obs = generate_ddf_obs(
+        mjd_start=mjd_start,
+        season_unobs_frac=season_unobs_frac,
+        expt=expt,
+        nsnaps=nsnaps,
+        n_proc=n_proc,
+        data_file=data_file,
+    )
+    os.makedirs(cache_dir, exist_ok=True)
+    atomic_save(filename, obs)
+    return obs
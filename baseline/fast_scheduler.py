@@ -0,0 +1,300 @@
+# A CoreScheduler that skips work which cannot change the decision,
+# with timing instrumentation to show what it saves.
+
+__all__ = ("FastCoreScheduler",)
+
+import time
+
+import numpy as np
+
+from rubin_scheduler.scheduler.schedulers import CoreScheduler
+from rubin_scheduler.scheduler.surveys import ToOScriptedSurvey
+from rubin_scheduler.scheduler.utils import ObservationArray
+
+from note_classes import NoteClassifier, add_accepted_observation, uses_base_add_observation
+from reward_bounds import survey_reward_bound
+from scheduled_index import ScheduledObsIndex
+from shared_features import share_features, use_shared_season_weights
+
+
+class FastCoreScheduler(CoreScheduler):
+    """CoreScheduler with fast paths for tiers that cannot be chosen
+
+    A tier made up entirely of `ToOScriptedSurvey` objects can only
+    return a finite reward if a new ToO event has arrived, or a
+    follow-up observation from an earlier event is still waiting to
+    be executed. The scheduler keeps an index of both (the highest
+    event id the tier has seen, and the latest flush_by_mjd of any
+    pending follow-up) and skips the whole tier when neither applies.
+
+    Within a tier, surveys are evaluated in order of a cheap upper
+    bound on their reward (see `reward_bounds.survey_reward_bound`),
+    and surveys whose bound is below the best reward found so far are
+    never evaluated (branch-and-bound over surveys).
+
+    The scheduled observation times of all surveys are kept in a
+    `ScheduledObsIndex`, so updating the conditions is a binary search
+    rather than a concatenate and sort of every scripted observation.
+
+    Identical survey features (same class and parameters, for surveys
+    ignoring the same observations) are shared, so each is updated
+    once per visit (see `shared_features.share_features`). Template
+    (NObsPerYear) basis functions share one season weight map per
+    decision (`shared_features.SharedNObsPerYearBasisFunction`).
+
+    Each observation's scheduler_note is classified once into a bitmask
+    of the ignore_obs patterns it contains (`note_classes.NoteClassifier`),
+    so each survey's ignore test is a bitwise AND with its precompiled
+    mask rather than a substring search per pattern.
+
+    Decisions are identical to `CoreScheduler`.
+
+    Parameters
+    ----------
+    surveys : list (or list of lists) of rubin_scheduler.scheduler.survey
+        As for `CoreScheduler`.
+    audit_every : `int`
+        Evaluate a skippable tier anyway every this many skips, to
+        check the skip was valid and to time what a skip saves.
+        Default 500.
+    branch_bound : `bool`
+        Skip surveys whose reward bound can't beat the best reward in
+        their tier. Default True.
+    bound_tol : `float`
+        Only skip surveys whose bound is below the best reward by
+        more than this, to allow for round-off. Default 1e-6.
+    dedup_features : `bool`
+        Share identical features between surveys. Default True.
+    **kwargs
+        Passed to `CoreScheduler`.
+    """
+
+    def __init__(
+        self, surveys, audit_every=500, branch_bound=True, bound_tol=1e-6, dedup_features=True, **kwargs
+    ):
+        super().__init__(surveys, **kwargs)
+        self.audit_every = audit_every
+        self.branch_bound = branch_bound
+        self.bound_tol = bound_tol
+        self.scheduled_index = ScheduledObsIndex()
+        use_shared_season_weights(self.survey_lists)
+        self.n_shared_features = 0
+        if dedup_features:
+            self.n_shared_features = share_features(self.survey_lists)
+
+        # ignore_obs masks, for surveys that use BaseSurvey's ignore test
+        self.note_classifier = NoteClassifier(
+            [pattern for surveys in self.survey_lists for survey in surveys for pattern in survey.ignore_obs]
+        )
+        self.ignore_masks = [
+            [
+                self.note_classifier.survey_mask(survey.ignore_obs) if uses_base_add_observation(survey) else None
+                for survey in surveys
+            ]
+            for surveys in self.survey_lists
+        ]
+
+        # Tiers where the active-ToO index applies
+        self.too_tiers = [
+            ns
+            for ns, tier in enumerate(self.survey_lists)
+            if (len(tier) > 0) & all([isinstance(survey, ToOScriptedSurvey) for survey in tier])
+        ]
+        # Pending follow-ups can't be observed after this mjd
+        self.too_active_until = {ns: -np.inf for ns in self.too_tiers}
+
+        # Instrumentation
+        self.tier_time = np.zeros(len(self.survey_lists))
+        self.tier_calls = np.zeros(len(self.survey_lists), dtype=int)
+        self.tier_idle_time = np.zeros(len(self.survey_lists))
+        self.tier_idle_calls = np.zeros(len(self.survey_lists), dtype=int)
+        self.tier_skips = np.zeros(len(self.survey_lists), dtype=int)
+        self.tier_pruned = np.zeros(len(self.survey_lists), dtype=int)
+        self.tier_evaluated = np.zeros(len(self.survey_lists), dtype=int)
+
+    def add_observation(self, observation):
+        """
+        Record a completed observation and update features accordingly.
+
+        Parameters
+        ----------
+        observation : dict-like
+            An object that contains the relevant information about a
+            completed observation
+            (e.g., mjd, ra, dec, filter, rotation angle, etc)
+        """
+        if len(observation.shape) == 0:
+            full_obs = ObservationArray()
+            full_obs[0] = observation
+            observation = full_obs
+
+        indx = self.pointing2hpindx(
+            observation["RA"][0], observation["dec"][0], rotSkyPos=observation["rotSkyPos"][0]
+        )
+        # The same string BaseSurvey.add_observation searches
+        note_mask = self.note_classifier.classify(str(observation["scheduler_note"]))
+        for surveys, ignore_masks in zip(self.survey_lists, self.ignore_masks):
+            for survey, ignore_mask in zip(surveys, ignore_masks):
+                if ignore_mask is None:
+                    survey.add_observation(observation, indx=indx)
+                elif (note_mask & ignore_mask) == 0:
+                    add_accepted_observation(survey, observation, indx=indx)
+
+    def update_conditions(self, conditions_in):
+        """
+        Parameters
+        ----------
+        conditions : dict-like
+            The current conditions of the telescope (pointing position,
+            loaded filters, cloud-mask, etc)
+        """
+        self.conditions = conditions_in
+        self.conditions.queue = self.queue
+        self.scheduled_index.update(
+            [survey.get_scheduled_obs() for surveys in self.survey_lists for survey in surveys]
+        )
+        self.conditions.scheduled_observations = self.scheduled_index.pending(self.conditions.mjd)
+
+    def _too_tier_idle(self, ns):
+        """Can the ToO tier ns be skipped under the current conditions"""
+        if self.conditions.mjd < self.too_active_until[ns]:
+            return False
+        toos = self.conditions.targets_of_opportunity
+        if toos is not None:
+            last_seen = np.min([survey.last_event_id for survey in self.survey_lists[ns]])
+            if np.max([too.id for too in toos]) > last_seen:
+                return False
+        return True
+
+    def _update_too_index(self, ns):
+        """Refresh the latest time any pending ToO follow-up can run"""
+        active_until = -np.inf
+        for survey in self.survey_lists[ns]:
+            obs_wanted = survey.obs_wanted
+            if obs_wanted is not None and obs_wanted.size > 0:
+                pending = np.where(~obs_wanted["observed"])[0]
+                if pending.size > 0:
+                    active_until = max(active_until, np.max(obs_wanted["flush_by_mjd"][pending]))
+        self.too_active_until[ns] = active_until
+
+    def _tier_rewards(self, ns, surveys):
+        """Max reward of each survey in a tier
+
+        Surveys skipped by the bound get -inf; they could not have
+        had the (first) highest reward.
+        """
+        rewards = np.zeros(len(surveys)) - np.inf
+        if self.branch_bound:
+            bounds = np.array([survey_reward_bound(survey, self.conditions) for survey in surveys])
+            bounds[np.isnan(bounds)] = np.inf
+            # Stable, so ties keep survey order
+            order = np.argsort(-bounds, kind="stable")
+        else:
+            bounds = np.zeros(len(surveys)) + np.inf
+            order = np.arange(len(surveys))
+        best = -np.inf
+        n_evaluated = 0
+        for i in order:
+            # Bounds are sorted, nothing left can beat the best
+            if bounds[i] < best - self.bound_tol:
+                break
+            # A survey with a bound of -inf is infeasible
+            if bounds[i] == -np.inf:
+                continue
+            # For each survey, find the highest reward value.
+            rewards[i] = np.nanmax(surveys[i].calc_reward_function(self.conditions))
+            n_evaluated += 1
+            if rewards[i] > best:
+                best = rewards[i]
+        self.tier_evaluated[ns] += n_evaluated
+        self.tier_pruned[ns] += len(surveys) - n_evaluated
+        return rewards
+
+    def _fill_queue(self):
+        """
+        Compute reward function for each survey and fill the observing queue
+        with the observations from the highest reward survey.
+        """
+        try:
+            keep_rewards = self.keep_rewards
+        except AttributeError:
+            keep_rewards = False
+        # Recording rewards needs every survey evaluated
+        if keep_rewards:
+            return super()._fill_queue()
+
+        rewards = None
+        for ns, surveys in enumerate(self.survey_lists):
+            audit = False
+            if ns in self.too_active_until:
+                if self._too_tier_idle(ns):
+                    self.tier_skips[ns] += 1
+                    audit = self.tier_skips[ns] % self.audit_every == 0
+                    if not audit:
+                        rewards = np.zeros(len(surveys)) - np.inf
+                        continue
+                    self.tier_skips[ns] -= 1
+
+            t0 = time.perf_counter()
+            rewards = self._tier_rewards(ns, surveys)
+            dt = time.perf_counter() - t0
+            self.tier_time[ns] += dt
+            self.tier_calls[ns] += 1
+            if ns in self.too_active_until:
+                self._update_too_index(ns)
+            # If we have a tier with a good reward, break out of the loop
+            if np.nanmax(rewards) > -np.inf:
+                if audit:
+                    self.log.warning(f"Tier {ns} would have been skipped at {self.conditions.mjd}")
+                self.survey_index[0] = ns
+                break
+            self.tier_idle_time[ns] += dt
+            self.tier_idle_calls[ns] += 1
+        if (np.nanmax(rewards) == -np.inf) | (np.isnan(np.nanmax(rewards))):
+            self.flush_queue()
+        else:
+            to_fix = np.where(np.isnan(rewards) == True)
+            rewards[to_fix] = -np.inf
+            # Take a min here, so the surveys will be executed in the order
+            # they are entered if there is a tie.
+            self.survey_index[1] = np.min(np.where(rewards == np.nanmax(rewards)))
+            # Survey return list of observations
+            result = self.survey_lists[self.survey_index[0]][self.survey_index[1]].generate_observations(
+                self.conditions
+            )
+
+            self.queue = result
+            self.queue_filled = self.conditions.mjd
+
+        if len(self.queue) == 0:
+            self.log.warning(f"Failed to fill queue at time {self.conditions.mjd}")
+
+    def timing_report(self):
+        """Per-tier reward evaluation time and estimated savings
+
+        Savings for a skipped tier are estimated from the mean time of
+        evaluations of that tier that found nothing to observe. Evaluated
+        and pruned count surveys whose reward was computed or skipped
+        by the bound (or as infeasible).
+        """
+        lines = [
+            "%5s %10s %10s %10s %12s %10s %10s"
+            % ("tier", "calls", "time (s)", "skipped", "saved (s)", "evaluated", "pruned")
+        ]
+        for ns in range(len(self.survey_lists)):
+            saved = 0.0
+            if self.tier_idle_calls[ns] > 0:
+                saved = self.tier_skips[ns] * self.tier_idle_time[ns] / self.tier_idle_calls[ns]
+            lines.append(
+                "%5i %10i %10.1f %10i %12.1f %10i %10i"
+                % (
+                    ns,
+                    self.tier_calls[ns],
+                    self.tier_time[ns],
+                    self.tier_skips[ns],
+                    saved,
+                    self.tier_evaluated[ns],
+                    self.tier_pruned[ns],
+                )
+            )
+        return "\n".join(lines)
@@ -0,0 +1,116 @@
+# Time broadcasting completed observations to every survey's features,
+# with and without identical features shared (shared_features).
+
+__all__ = ("synthetic_observations", "compare_features")
+
+import copy
+import time
+
+import numpy as np
+
+from rubin_scheduler.scheduler.utils import ObservationArray, SchemaConverter
+from rubin_scheduler.utils import SURVEY_START_MJD
+
+from baseline import gen_scheduler, sched_argparser
+from shared_features import count_feature_updates, share_features
+
+NOTES = ["blob, gr, a", "blob, gr, b", "blob_twi, iz, a", "greedy", "DD:COSMOS", "pair_15, ri, a", "long"]
+
+
+def synthetic_observations(n_obs, mjd_start=SURVEY_START_MJD, seed=42):
+    """Random pointings over the sky, a few minutes apart
+
+    Parameters
+    ----------
+    n_obs : `int`
+        Number of observations.
+    mjd_start : `float`
+        MJD of the first observation. Default SURVEY_START_MJD.
+    seed : `int`
+        Random seed. Default 42.
+
+    Returns
+    -------
+    observations : `rubin_scheduler.scheduler.utils.ObservationArray`
+    """
+    rng = np.random.default_rng(seed)
+    obs = ObservationArray(n=n_obs)
+    obs["RA"] = rng.uniform(0, 2.0 * np.pi, n_obs)
+    obs["dec"] = np.arcsin(rng.uniform(-1, np.sin(np.radians(20.0)), n_obs))
+    obs["rotSkyPos"] = rng.uniform(0, 2.0 * np.pi, n_obs)
+    obs["mjd"] = mjd_start + np.cumsum(rng.uniform(30.0, 180.0, n_obs)) / 3600.0 / 24.0
+    obs["night"] = np.floor(obs["mjd"] - mjd_start).astype(int) + 1
+    obs["filter"] = rng.choice(list("ugrizy"), n_obs)
+    obs["scheduler_note"] = rng.choice(NOTES, n_obs)
+    obs["exptime"] = 30.0
+    obs["nexp"] = 2
+    obs["airmass"] = rng.uniform(1.0, 2.0, n_obs)
+    obs["FWHMeff"] = rng.uniform(0.5, 1.5, n_obs)
+    obs["fivesigmadepth"] = rng.uniform(22.0, 25.0, n_obs)
+    return obs
+
+
+def _features(scheduler):
+    """(survey, basis function, name, feature values) for every feature"""
+    for surveys in scheduler.survey_lists:
+        for survey in surveys:
+            for i, basis_function in enumerate(survey.basis_functions):
+                for name, feature in basis_function.survey_features.items():
+                    yield survey.survey_name, i, name, feature.feature
+
+
+def compare_features(scheduler_a, scheduler_b):
+    """Number of features that differ between two schedulers
+
+    The schedulers should have been built the same way.
+    """
+    n_diff = 0
+    for (survey_name, i, name, value_a), (_sn, _i, _n, value_b) in zip(
+        _features(scheduler_a), _features(scheduler_b)
+    ):
+        try:
+            same = np.array_equal(value_a, value_b, equal_nan=True)
+        except TypeError:
+            same = np.array_equal(value_a, value_b)
+        if not same:
+            print("  differs: %s, basis function %i, %s" % (survey_name, i, name))
+            n_diff += 1
+    return n_diff
+
+
+def _time_adds(scheduler, observations):
+    t0 = time.time()
+    for observation in observations:
+        scheduler.add_observation(observation)
+    return time.time() - t0
+
+
+if __name__ == "__main__":
+    parser = sched_argparser()
+    parser.add_argument("--n_obs", type=int, default=2000, help="Number of synthetic observations to add")
+    parser.add_argument("--obs_db", type=str, default=None, help="Add observations from this run database")
+    args = parser.parse_args()
+    args.setup_only = True
+    args.fast_scheduler = False
+
+    scheduler = gen_scheduler(args)
+    shared = copy.deepcopy(scheduler)
+    n_before = count_feature_updates(scheduler.survey_lists)
+    n_shared = share_features(shared.survey_lists)
+    n_after = count_feature_updates(shared.survey_lists)
+
+    if args.obs_db is None:
+        observations = synthetic_observations(args.n_obs)
+    else:
+        observations = SchemaConverter().opsim2obs(args.obs_db)[: args.n_obs]
+
+    t_before = _time_adds(scheduler, observations)
+    t_after = _time_adds(shared, observations)
+
+    print("Features updated per visit: %i, with sharing %i (%i shared)" % (n_before, n_after, n_shared))
+    print(
+        "add_observation: %.2f ms per visit, with sharing %.2f ms per visit (%i visits)"
+        % (t_before / observations.size * 1e3, t_after / observations.size * 1e3, observations.size)
+    )
+    n_diff = compare_features(scheduler, shared)
+    print("%i features differ" % n_diff)
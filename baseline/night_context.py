@@ -0,0 +1,85 @@
+# Quantities that are fixed for a night, computed once at the start of
+# the night rather than re-interpolated from the almanac on every visit.
+
+__all__ = ("NightContext", "NightCachedAlmanac")
+
+import numpy as np
+
+
+class NightContext:
+    """Night-level quantities for one night
+
+    Parameters
+    ----------
+    sunsets_row : `np.ndarray`
+        The night's row of the almanac sunsets table (night index,
+        sunset, twilight and moon rise/set times).
+    sun_moon_sunset : `dict`
+        Sun and moon positions (and moon phase) at sunset, as returned
+        by `Almanac.get_sun_moon_positions`.
+    """
+
+    def __init__(self, sunsets_row, sun_moon_sunset):
+        for name in sunsets_row.dtype.names:
+            setattr(self, name, sunsets_row[name])
+        self.sun_moon_sunset = sun_moon_sunset
+        self.moon_phase_sunset = sun_moon_sunset["moon_phase"]
+
+
+class NightCachedAlmanac:
+    """Almanac wrapper that keeps a `NightContext` for the current night
+
+    ModelObservatory.return_conditions asks for the sun and moon
+    positions at sunset on every visit (for moon_phase_sunset), which
+    means 13 interpolations of the almanac for a value that only
+    changes once a night. Queries at the current night's sunset are
+    answered from the night context instead. Everything else is passed
+    through to the wrapped almanac.
+
+    Parameters
+    ----------
+    almanac : `rubin_scheduler.site_models.Almanac`
+        The almanac to wrap.
+    """
+
+    def __init__(self, almanac):
+        self.almanac = almanac
+        self.context = None
+        self.context_indx = None
+        self.n_nights = 0
+        self.n_hits = 0
+
+    def __getattr__(self, name):
+        # Only called for attributes not found on the wrapper. Guard
+        # against recursion before almanac is set (e.g., when copying).
+        if name == "almanac":
+            raise AttributeError(name)
+        return getattr(self.almanac, name)
+
+    def night_context(self, mjd):
+        """The `NightContext` for the night containing mjd"""
+        indx = self.almanac.mjd_indx(mjd)
+        if indx != self.context_indx:
+            sunsets_row = self.almanac.sunsets[indx]
+            self.context = NightContext(
+                sunsets_row, self.almanac.get_sun_moon_positions(sunsets_row["sunset"])
+            )
+            self.context_indx = indx
+            self.n_nights += 1
+        return self.context
+
+    def get_sun_moon_positions(self, mjd):
+        if np.ndim(mjd) == 0:
+            if self.almanac.sunsets["sunset"][self.almanac.mjd_indx(mjd)] == mjd:
+                self.n_hits += 1
+                context = self.night_context(mjd)
+                # Copies, callers may modify the result
+                return {key: np.copy(value) for key, value in context.sun_moon_sunset.items()}
+        return self.almanac.get_sun_moon_positions(mjd)
+
+    def report(self):
+        """Summary of how many almanac lookups were saved"""
+        return "Night context: %i nights, %i start-of-night lookups served from cache" % (
+            self.n_nights,
+            self.n_hits - self.n_nights,
+        )
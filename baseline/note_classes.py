@@ -0,0 +1,70 @@
+# Classify each observation's scheduler_note once into a bitmask of the
+# ignore_obs patterns it contains, so each survey's ignore test is a
+# single bitwise AND rather than a substring search per pattern.
+
+__all__ = ("NoteClassifier", "add_accepted_observation", "uses_base_add_observation")
+
+from rubin_scheduler.scheduler.surveys import BaseSurvey
+
+
+class NoteClassifier:
+    """Bitmasks of the ignore_obs patterns found in scheduler notes
+
+    Each distinct pattern gets a bit. Survey notes (blob, pairs,
+    greedy) repeat, so the mask of each note is cached. Scripted DDF
+    and ToO notes carry a per-visit index and never repeat, so the
+    cache is emptied whenever it reaches max_notes rather than growing
+    over the run.
+
+    Parameters
+    ----------
+    patterns : iterable of `str`
+        The ignore_obs patterns of every survey.
+    max_notes : `int`
+        Most notes to cache. Default 1024.
+    """
+
+    def __init__(self, patterns, max_notes=1024):
+        self.patterns = sorted(set(patterns))
+        self.bits = {pattern: 1 << i for i, pattern in enumerate(self.patterns)}
+        self.max_notes = max_notes
+        self.note_masks = {}
+
+    def survey_mask(self, ignore_obs):
+        """Mask of a survey's ignore_obs patterns"""
+        mask = 0
+        for pattern in ignore_obs:
+            mask |= self.bits[pattern]
+        return mask
+
+    def classify(self, note):
+        """Mask of the patterns that are substrings of note"""
+        mask = self.note_masks.get(note)
+        if mask is None:
+            mask = 0
+            for pattern in self.patterns:
+                if pattern in note:
+                    mask |= self.bits[pattern]
+            if len(self.note_masks) >= self.max_notes:
+                self.note_masks.clear()
+            self.note_masks[note] = mask
+        return mask
+
+
+def add_accepted_observation(survey, observation, **kwargs):
+    """`BaseSurvey.add_observation` for an observation already known
+    not to match any of the survey's ignore_obs patterns"""
+    for feature in survey.extra_features:
+        survey.extra_features[feature].add_observation(observation, **kwargs)
+    for basis_function in survey.extra_basis_functions:
+        survey.extra_basis_functions[basis_function].add_observation(observation, **kwargs)
+    for basis_function in survey.basis_functions:
+        basis_function.add_observation(observation, **kwargs)
+    for detailer in survey.detailers:
+        detailer.add_observation(observation, **kwargs)
+    survey.reward_checked = False
+
+
+def uses_base_add_observation(survey):
+    """True if the survey filters observations with BaseSurvey's ignore_obs test"""
+    return type(survey).add_observation is BaseSurvey.add_observation
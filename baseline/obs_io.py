@@ -0,0 +1,487 @@
+# Readers and writers for simulated observations beyond the default
+# sqlite output of sim_runner.
+
+__all__ = (
+    "write_parquet",
+    "read_parquet",
+    "index_observations_db",
+    "snapshot_db",
+    "add_snapshot_views",
+    "iter_observations",
+    "sky_counts",
+    "add_columns_db",
+    "encode_strings",
+    "encode_notes_db",
+    "atomic_save",
+)
+
+import json
+import os
+import sqlite3
+
+import numpy as np
+
+from rubin_scheduler.scheduler.utils import SchemaConverter
+
+
+# String columns with few distinct values, stored as integer codes
+ENCODED_COLUMNS = ["scheduler_note", "target_name"]
+
+
+def write_parquet(observations, filename, info=None, compression="zstd", extra_columns=None):
+    """Write observations to a parquet file, one row group per night
+
+    Columns use the same (opsim) names and units as the sqlite
+    observations table, so analysis code can switch between the two.
+    scheduler_note and target_name are dictionary encoded (and read
+    back as pandas categoricals).
+
+    Parameters
+    ----------
+    observations : `np.ndarray`
+        Observation array, as returned by `sim_runner`.
+    filename : `str`
+        Output parquet filename.
+    info : `dict`
+        Run information (e.g., extra_info from `set_run_info`), stored
+        in the file metadata. Default None.
+    compression : `str`
+        Parquet compression codec. Default "zstd".
+    extra_columns : `dict`
+        Additional columns (arrays matching observations) to write,
+        keyed by column name. Default None.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    order = np.argsort(observations["mjd"], kind="stable")
+    df = SchemaConverter().obs2opsim(observations[order])
+    # Dictionary encode the highly repetitive string columns
+    for name in ENCODED_COLUMNS:
+        df[name] = df[name].astype("category")
+    if extra_columns is not None:
+        for name, values in extra_columns.items():
+            df[name] = np.asarray(values)[order]
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    if info is not None:
+        metadata = dict(table.schema.metadata)
+        # git hashes come back from subprocess as bytes
+        info = {key: val.decode().strip() if isinstance(val, bytes) else str(val) for key, val in info.items()}
+        metadata[b"info"] = json.dumps(info).encode()
+        table = table.replace_schema_metadata(metadata)
+
+    # Observations are in time order, so each night is a contiguous slice
+    _nights, starts, counts = np.unique(df["night"].values, return_index=True, return_counts=True)
+    with pq.ParquetWriter(filename, table.schema, compression=compression) as writer:
+        for start, count in zip(starts, counts):
+            writer.write_table(table.slice(start, count))
+
+
+def read_parquet(filename, columns=None, night_min=None, night_max=None):
+    """Read observations from a parquet file written by `write_parquet`
+
+    Only the requested columns and the row groups of the requested
+    nights are read from disk.
+
+    Parameters
+    ----------
+    filename : `str`
+        Parquet filename.
+    columns : `list` [`str`]
+        Columns to read. Default None reads all.
+    night_min, night_max : `int`
+        Range of nights to read (inclusive). Default None, no limit.
+
+    Returns
+    -------
+    df : `pd.DataFrame`
+        Observations, with opsim column names.
+    """
+    import pyarrow.parquet as pq
+
+    filters = []
+    if night_min is not None:
+        filters.append(("night", ">=", night_min))
+    if night_max is not None:
+        filters.append(("night", "<=", night_max))
+    if len(filters) == 0:
+        filters = None
+    table = pq.read_table(filename, columns=columns, filters=filters)
+    return table.to_pandas()
+
+
+def _observations_table(con):
+    """Name of the table holding the observation rows
+
+    observations is a view over observations_encoded if the
+    database has been through `encode_notes_db`.
+    """
+    kind = con.execute("SELECT type FROM sqlite_master WHERE name = 'observations'").fetchone()
+    if kind is not None and kind[0] == "view":
+        return "observations_encoded"
+    return "observations"
+
+
+def index_observations_db(filename):
+    """Index the observations table on night and observationStartMJD
+
+    Makes night and time range queries (e.g., early survey snapshots)
+    use the index rather than scanning the full table.
+
+    Parameters
+    ----------
+    filename : `str`
+        Sqlite database written by `sim_runner`.
+    """
+    con = sqlite3.connect(filename)
+    table = _observations_table(con)
+    con.execute("CREATE INDEX IF NOT EXISTS idx_night ON %s (night)" % table)
+    con.execute("CREATE INDEX IF NOT EXISTS idx_observationStartMJD ON %s (observationStartMJD)" % table)
+    con.commit()
+    con.close()
+
+
+def _create_table_like(con, source, target):
+    """Create an empty table with the columns and declared types of source"""
+    schema, table = source.split(".")
+    columns = con.execute("PRAGMA %s.table_info(%s)" % (schema, table)).fetchall()
+    con.execute(
+        "CREATE TABLE %s (%s)" % (target, ", ".join(['"%s" %s' % (row[1], row[2]) for row in columns]))
+    )
+
+
+def snapshot_db(filename, night, out_filename):
+    """Copy the first nights of a run to a new database
+
+    Rows are copied inside sqlite (via an attached database),
+    so the full table is never loaded into memory.
+
+    Parameters
+    ----------
+    filename : `str`
+        Sqlite database written by `sim_runner`.
+    night : `int`
+        Copy observations with night <= this.
+    out_filename : `str`
+        Database to write. Overwritten if it exists.
+    """
+    if os.path.isfile(out_filename):
+        os.remove(out_filename)
+    con = sqlite3.connect(filename)
+    con.execute("ATTACH DATABASE ? AS snapshot", (out_filename,))
+    # Explicit schema, CREATE TABLE ... AS SELECT would only keep
+    # the type affinities (e.g., INT for INTEGER, NUM for BOOLEAN)
+    _create_table_like(con, "main.observations", "snapshot.observations")
+    con.execute(
+        "INSERT INTO snapshot.observations SELECT * FROM main.observations "
+        "WHERE night <= ? ORDER BY observationStartMJD",
+        (night,),
+    )
+    tables = [row[0] for row in con.execute("SELECT name FROM main.sqlite_master WHERE type='table'")]
+    if "info" in tables:
+        con.execute("CREATE TABLE snapshot.info AS SELECT * FROM main.info")
+    con.execute("CREATE INDEX snapshot.idx_night ON observations (night)")
+    con.commit()
+    con.execute("DETACH DATABASE snapshot")
+    con.close()
+
+
+def add_snapshot_views(filename, nights):
+    """Add views of the first nights of a run to its database
+
+    A lighter-weight alternative to `snapshot_db`, for tools that can
+    read from a view, e.g. "select * from observations_n30".
+
+    Parameters
+    ----------
+    filename : `str`
+        Sqlite database written by `sim_runner`.
+    nights : `list` [`int`]
+        Add a view observations_n<night> for each night.
+    """
+    con = sqlite3.connect(filename)
+    for night in nights:
+        con.execute(
+            "CREATE VIEW IF NOT EXISTS observations_n%i AS SELECT * FROM observations WHERE night <= %i"
+            % (night, night)
+        )
+    con.commit()
+    con.close()
+
+
+def _sqlite_dtype(declared_type):
+    """numpy dtype for a sqlite declared column type
+
+    Follows sqlite's type affinity rules, since tables made with
+    CREATE TABLE ... AS SELECT (e.g., by `snapshot_db`) declare
+    affinity names such as INT and NUM rather than the original types.
+    """
+    declared_type = declared_type.upper()
+    if "INT" in declared_type:
+        return int
+    if any([name in declared_type for name in ("CHAR", "CLOB", "TEXT")]):
+        return object
+    if ("BLOB" in declared_type) or (declared_type == ""):
+        return object
+    if "BOOL" in declared_type:
+        return bool
+    # REAL, FLOAT, DOUBLE and NUMERIC affinity
+    return float
+
+
+def _iter_sqlite(filename, columns, chunk_size, per_night):
+    con = sqlite3.connect(filename)
+    column_types = {row[1]: row[2] for row in con.execute("PRAGMA table_info(observations)")}
+    if columns is None:
+        columns = list(column_types.keys())
+    dtype = [(name, _sqlite_dtype(column_types[name])) for name in columns]
+
+    query = "SELECT %s FROM observations" % ", ".join(columns)
+    if per_night:
+        # Need the night to split on, even if not requested
+        query = "SELECT %s, night FROM observations ORDER BY night, observationStartMJD" % ", ".join(columns)
+        dtype_with_night = dtype + [("_night", int)]
+    cursor = con.execute(query)
+
+    leftover = None
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if len(rows) == 0:
+            break
+        if not per_night:
+            yield np.array(rows, dtype=dtype)
+            continue
+        chunk = np.array(rows, dtype=dtype_with_night)
+        if leftover is not None:
+            chunk = np.concatenate([leftover, chunk])
+        # Hold back the last night, it may continue in the next chunk
+        _nights, starts = np.unique(chunk["_night"], return_index=True)
+        for start, end in zip(starts[:-1], starts[1:]):
+            yield _drop_night(chunk[start:end], columns)
+        leftover = chunk[starts[-1] :]
+    if per_night and leftover is not None:
+        yield _drop_night(leftover, columns)
+    con.close()
+
+
+def _drop_night(chunk, columns):
+    result = np.empty(chunk.size, dtype=[(name, chunk.dtype[name]) for name in columns])
+    for name in columns:
+        result[name] = chunk[name]
+    return result
+
+
+def _iter_parquet(filename, columns, chunk_size, per_night):
+    import pyarrow.parquet as pq
+
+    parquet_file = pq.ParquetFile(filename)
+    if per_night:
+        # write_parquet puts each night in its own row group
+        batches = (
+            parquet_file.read_row_group(i, columns=columns) for i in range(parquet_file.num_row_groups)
+        )
+    else:
+        batches = parquet_file.iter_batches(batch_size=chunk_size, columns=columns)
+    for batch in batches:
+        yield batch.to_pandas().to_records(index=False)
+
+
+def iter_observations(filename, columns=None, chunk_size=100000, per_night=False):
+    """Iterate over the observations of a run in bounded memory
+
+    Parameters
+    ----------
+    filename : `str`
+        Sqlite database written by `sim_runner` or a parquet
+        file written by `write_parquet` (ending in .parquet).
+    columns : `list` [`str`]
+        Columns to read (opsim names). Default None reads all.
+    chunk_size : `int`
+        Number of rows per chunk. Default 100000.
+    per_night : `bool`
+        Yield one chunk per night instead of every chunk_size rows.
+        Default False.
+
+    Yields
+    ------
+    chunk : `np.ndarray`
+        Structured array of observations. String columns have
+        object dtype for sqlite input.
+    """
+    if filename.endswith(".parquet"):
+        yield from _iter_parquet(filename, columns, chunk_size, per_night)
+    else:
+        yield from _iter_sqlite(filename, columns, chunk_size, per_night)
+
+
+def sky_counts(sky_brightness, exptime, filters, zeropoints, pixscale=0.2):
+    """Sky counts per pixel in each exposure
+
+    Parameters
+    ----------
+    sky_brightness : `np.ndarray`
+        Sky brightness (mag/sq arcsec).
+    exptime : `np.ndarray`
+        Exposure time of each exposure (seconds), i.e.
+        visitExposureTime/numExposures.
+    filters : `np.ndarray`
+        Filter name of each visit.
+    zeropoints : `dict`
+        Instrumental zeropoint (mag giving one count per second)
+        keyed by filter name, e.g. from
+        `rubin_sim.maf.utils.load_inst_zeropoints`.
+    pixscale : `float`
+        Pixel scale (arcsec). Default 0.2.
+
+    Returns
+    -------
+    counts : `np.ndarray`
+        Sky counts per pixel. NaN for filters not in zeropoints.
+    """
+    filternames, filter_index = np.unique(np.asarray(filters), return_inverse=True)
+    zp = np.array([zeropoints.get(filtername, np.nan) for filtername in filternames])[filter_index]
+    return 10.0 ** (0.4 * (zp - np.asarray(sky_brightness))) * pixscale**2 * np.asarray(exptime)
+
+
+def add_columns_db(filename, observation_ids, columns):
+    """Add columns to the observations table of a run database
+
+    Parameters
+    ----------
+    filename : `str`
+        Sqlite database written by `sim_runner`.
+    observation_ids : `np.ndarray`
+        observationId of each row of the new values.
+    columns : `dict`
+        Arrays of values keyed by new column name.
+    """
+    names = list(columns.keys())
+    sql_types = {}
+    for name in names:
+        kind = np.asarray(columns[name]).dtype.kind
+        sql_types[name] = {"b": "BOOLEAN", "i": "INTEGER", "u": "INTEGER", "f": "REAL"}.get(kind, "TEXT")
+
+    con = sqlite3.connect(filename)
+    # Stage the values in a temporary table keyed on observationId,
+    # so the update is a keyed lookup rather than a scan per row
+    con.execute(
+        "CREATE TEMP TABLE new_columns (observationId INTEGER PRIMARY KEY, %s)"
+        % ", ".join(["%s %s" % (name, sql_types[name]) for name in names])
+    )
+    rows = zip(
+        np.asarray(observation_ids).tolist(), *[np.asarray(columns[name]).tolist() for name in names]
+    )
+    con.executemany("INSERT INTO temp.new_columns VALUES (%s)" % ", ".join(["?"] * (len(names) + 1)), rows)
+    for name in names:
+        con.execute("ALTER TABLE observations ADD COLUMN %s %s" % (name, sql_types[name]))
+        con.execute(
+            "UPDATE observations SET %s = (SELECT %s FROM temp.new_columns AS t "
+            "WHERE t.observationId = observations.observationId)" % (name, name)
+        )
+    con.execute("DROP TABLE temp.new_columns")
+    con.commit()
+    con.close()
+
+
+def encode_strings(values):
+    """Dictionary encode an array of strings
+
+    Parameters
+    ----------
+    values : `np.ndarray`
+        Array of strings (e.g., scheduler_note).
+
+    Returns
+    -------
+    codes : `np.ndarray`
+        Integer code of each value, so values == categories[codes].
+    categories : `np.ndarray`
+        The sorted unique values.
+    """
+    categories, codes = np.unique(np.asarray(values), return_inverse=True)
+    dtype = np.int16 if categories.size < np.iinfo(np.int16).max else np.int32
+    return codes.astype(dtype), categories
+
+
+def encode_notes_db(filename):
+    """Store scheduler_note and target_name as integer codes
+
+    The rows move to an observations_encoded table with
+    scheduler_note_code and target_name_code columns, the strings go to
+    scheduler_note_codes and target_name_codes lookup tables, and
+    observations becomes a view that decodes them, so existing queries
+    keep working.
+
+    Parameters
+    ----------
+    filename : `str`
+        Sqlite database written by `sim_runner`.
+    """
+    con = sqlite3.connect(filename)
+    if _observations_table(con) == "observations_encoded":
+        con.close()
+        return
+    table_info = con.execute("PRAGMA table_info(observations)").fetchall()
+    columns = [row[1] for row in table_info]
+    plain = ", ".join(["o.%s" % name for name in columns if name not in ENCODED_COLUMNS])
+    for name in ENCODED_COLUMNS:
+        con.execute("CREATE TABLE %s_codes (code INTEGER PRIMARY KEY, %s TEXT UNIQUE)" % (name, name))
+        con.execute(
+            "INSERT INTO %s_codes (code, %s) SELECT ROW_NUMBER() OVER (ORDER BY %s) - 1, %s "
+            "FROM (SELECT DISTINCT %s FROM observations)" % (name, name, name, name, name)
+        )
+
+    # Explicit schema, so the other columns keep their declared types
+    con.execute(
+        "CREATE TABLE observations_encoded (%s)"
+        % ", ".join(
+            ['"%s" %s' % (row[1], row[2]) for row in table_info if row[1] not in ENCODED_COLUMNS]
+            + ["%s_code INTEGER" % name for name in ENCODED_COLUMNS]
+        )
+    )
+    con.execute(
+        "INSERT INTO observations_encoded SELECT %s, %s FROM observations AS o %s ORDER BY o.observationId"
+        % (
+            plain,
+            ", ".join(["c_%s.code" % name for name in ENCODED_COLUMNS]),
+            " ".join(
+                [
+                    "LEFT JOIN %s_codes AS c_%s ON c_%s.%s = o.%s" % (name, name, name, name, name)
+                    for name in ENCODED_COLUMNS
+                ]
+            ),
+        )
+    )
+    con.execute("DROP TABLE observations")
+    # Decoded columns in the original column order
+    decoded = ", ".join(
+        ["c_%s.%s" % (name, name) if name in ENCODED_COLUMNS else "o.%s" % name for name in columns]
+    )
+    con.execute(
+        "CREATE VIEW observations AS SELECT %s FROM observations_encoded AS o %s"
+        % (
+            decoded,
+            " ".join(
+                [
+                    "LEFT JOIN %s_codes AS c_%s ON c_%s.code = o.%s_code" % (name, name, name, name)
+                    for name in ENCODED_COLUMNS
+                ]
+            ),
+        )
+    )
+    con.commit()
+    # Reclaim the space of the dropped string table
+    con.execute("VACUUM")
+    con.close()
+    index_observations_db(filename)
+
+
+def atomic_save(filename, array):
+    """`np.save` array to filename (ending .npy)
+
+    Written to a temporary file then renamed, so parallel runs sharing
+    a cache never read a partial file.
+    """
+    temp_name = filename + ".%i.tmp.npy" % os.getpid()
+    np.save(temp_name, array)
+    os.replace(temp_name, filename)
@@ -0,0 +1,31 @@
+# Make early-survey snapshot databases (e.g., baseline_n30.db) from a
+# full run, without loading the full observations table into memory.
+
+import argparse
+import os
+
+from obs_io import add_snapshot_views, index_observations_db, snapshot_db
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", type=str, default="baseline_v4.1_10yrs.db", help="Full run database")
+    parser.add_argument("--nights", type=int, nargs="+", default=[7, 14, 30, 60, 90, 180, 360])
+    parser.add_argument("--outroot", type=str, default="baseline", help="Write outroot_n<night>.db")
+    parser.add_argument("--out_dir", type=str, default="", help="Output directory")
+    parser.add_argument(
+        "--views",
+        dest="views",
+        action="store_true",
+        help="Add observations_n<night> views to the run database instead of writing new databases",
+    )
+    parser.set_defaults(views=False)
+    args = parser.parse_args()
+
+    # Older runs were written without the night index
+    index_observations_db(args.db)
+
+    if args.views:
+        add_snapshot_views(args.db, args.nights)
+    else:
+        for night in args.nights:
+            snapshot_db(args.db, night, os.path.join(args.out_dir, "%s_n%i.db" % (args.outroot, night)))
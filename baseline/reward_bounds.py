@@ -0,0 +1,125 @@
+# Cheap upper bounds on the reward a survey can return, so surveys that
+# cannot beat the current best can be skipped without computing their
+# full reward maps.
+
+__all__ = ("BF_RANGES", "survey_reward_bound")
+
+import numpy as np
+
+import rubin_scheduler.scheduler.basis_functions as bf
+from rubin_scheduler.scheduler.surveys import BaseMarkovSurvey, BlobSurvey
+
+from shared_features import SharedNObsPerYearBasisFunction
+
+
+def _unit_range(basis_function, conditions):
+    """Basis functions with values between 0 and 1"""
+    return 0.0, 1.0
+
+
+def _scalar_range(basis_function, conditions):
+    """Basis functions that return a scalar, cheap to compute exactly"""
+    value = basis_function(conditions)
+    return value, value
+
+
+def _slewtime_range(basis_function, conditions):
+    """Minus the slewtime over max_time, or 0 in another filter"""
+    return -np.inf, 0.0
+
+
+def _m5_diff_range(basis_function, conditions):
+    """Range of the m5 depth minus the dark sky depth"""
+    if basis_function.dark_map is None:
+        return -np.inf, np.inf
+    diff = conditions.m5_depth[basis_function.filtername] - basis_function.dark_map
+    diff = diff[np.isfinite(diff)]
+    if diff.size == 0:
+        # The reward is all NaN, no better than -inf
+        return -np.inf, -np.inf
+    return np.min(diff), np.max(diff)
+
+
+def _footprint_range(basis_function, conditions):
+    """Desired number of visits minus the number taken
+
+    The desired number is at most the max of the normalized footprint
+    times the total number of visits; the number taken is >= 0.
+    """
+    desired = basis_function.footprint(conditions.mjd)[basis_function.filtername]
+    n_all = np.sum(basis_function.survey_features["N_obs_all"].feature)
+    upper = np.nanmax(desired) * n_all
+    if np.isfinite(basis_function.out_of_bounds_val):
+        upper = max(upper, basis_function.out_of_bounds_val)
+    return -np.inf, upper
+
+
+# (lower, upper) bounds on the values of each basis function class.
+# Only exact class matches are used, subclasses can change the values.
+BF_RANGES = {
+    bf.M5DiffBasisFunction: _m5_diff_range,
+    bf.FootprintBasisFunction: _footprint_range,
+    bf.SlewtimeBasisFunction: _slewtime_range,
+    bf.StrictFilterBasisFunction: _scalar_range,
+    bf.FilterChangeBasisFunction: _scalar_range,
+    bf.NObsPerYearBasisFunction: _unit_range,
+    SharedNObsPerYearBasisFunction: _unit_range,
+    bf.NGoodSeeingBasisFunction: _unit_range,
+    bf.VisitRepeatBasisFunction: _unit_range,
+    bf.NearSunHighAirmassBasisFunction: _unit_range,
+}
+
+# Reward functions that are the weighted sum of the basis functions
+WEIGHTED_SUM_REWARDS = (BaseMarkovSurvey.calc_reward_function, BlobSurvey.calc_reward_function)
+
+
+def survey_reward_bound(survey, conditions):
+    """Upper bound on the max reward a survey can return
+
+    Surveys can provide their own bound with a reward_upper_bound
+    method. Otherwise surveys whose reward is the weighted sum of
+    their basis functions are bounded by summing the bounds of each
+    weighted basis function (see `BF_RANGES`). Anything else is
+    unbounded.
+
+    Parameters
+    ----------
+    survey : `rubin_scheduler.scheduler.surveys.BaseSurvey`
+        The survey.
+    conditions : `rubin_scheduler.scheduler.features.Conditions`
+        The current conditions.
+
+    Returns
+    -------
+    bound : `float`
+        np.inf if no bound is known, -np.inf if the survey is
+        not feasible.
+    """
+    if hasattr(survey, "reward_upper_bound"):
+        return survey.reward_upper_bound(conditions)
+    if type(survey).calc_reward_function not in WEIGHTED_SUM_REWARDS:
+        return np.inf
+    # Smoothing could move the max
+    if survey.smoothing_kernel is not None:
+        return np.inf
+    # Not survey._check_feasibility, it can compute the full reward
+    for basis_function in survey.basis_functions:
+        if not basis_function.check_feasibility(conditions):
+            return -np.inf
+
+    bound = 0.0
+    for basis_function, weight in zip(survey.basis_functions, survey.basis_weights):
+        # Masks
+        if weight == 0:
+            continue
+        range_func = BF_RANGES.get(type(basis_function))
+        if range_func is None:
+            return np.inf
+        lower, upper = range_func(basis_function, conditions)
+        term = weight * upper if weight > 0 else weight * lower
+        # Basis function values are never +inf, so a -inf term
+        # makes the whole reward -inf (or NaN)
+        if term == -np.inf:
+            return -np.inf
+        bound += term
+    return bound
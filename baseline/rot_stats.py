@@ -0,0 +1,131 @@
+# Running statistics of rotator motion between consecutive visits.
+
+__all__ = ("RotatorDeltaHistograms",)
+
+import numpy as np
+
+from obs_io import encode_strings
+
+
+class RotatorDeltaHistograms:
+    """Histograms of rotTelPos changes between consecutive visits
+
+    Only consecutive visits with the same filter and the same
+    scheduler_note are counted (i.e., visits within a sequence of a
+    survey, where large rotator moves are unexpected). Observations
+    can be added in any number of time-ordered chunks.
+
+    Parameters
+    ----------
+    bin_width : `float`
+        Histogram bin width (degrees). Default 2.
+    thresholds : `list` [`float`]
+        Also count visits with |delta| over these (degrees).
+        Default [20, 30].
+    """
+
+    def __init__(self, bin_width=2.0, thresholds=[20.0, 30.0]):
+        self.bins = np.arange(-180.0, 180.0 + bin_width, bin_width)
+        self.thresholds = np.array(thresholds)
+        self.hists = {}
+        self.n_over = {}
+        self.max_abs = {}
+        self.last = None
+
+    def add_observations(self, rot_tel_pos, filters, notes):
+        """Add the next chunk of observations
+
+        Parameters
+        ----------
+        rot_tel_pos : `np.ndarray`
+            Rotator angle of each visit (degrees).
+        filters : `np.ndarray`
+            Filter of each visit.
+        notes : `np.ndarray`
+            scheduler_note of each visit.
+        """
+        rot_tel_pos = np.asarray(rot_tel_pos, dtype=float)
+        filters = np.asarray(filters).astype(str)
+        notes = np.asarray(notes).astype(str)
+        if rot_tel_pos.size == 0:
+            return
+        # Carry the last visit of the previous chunk
+        if self.last is not None:
+            rot_tel_pos = np.concatenate([[self.last[0]], rot_tel_pos])
+            filters = np.concatenate([[self.last[1]], filters])
+            notes = np.concatenate([[self.last[2]], notes])
+        self.last = (rot_tel_pos[-1], filters[-1], notes[-1])
+
+        delta = np.diff(rot_tel_pos)
+        filter_codes, _filternames = encode_strings(filters)
+        note_codes, unique_notes = encode_strings(notes)
+        same = np.where(
+            (filter_codes[1:] == filter_codes[:-1]) & (note_codes[1:] == note_codes[:-1]) & np.isfinite(delta)
+        )[0]
+        if same.size == 0:
+            return
+        delta = delta[same]
+        # Keep only the notes that have pairs
+        used_notes, note_index = np.unique(note_codes[1:][same], return_inverse=True)
+        unique_notes = unique_notes[used_notes]
+
+        bin_index = np.clip(np.digitize(delta, self.bins) - 1, 0, self.bins.size - 2)
+        hists = np.zeros((unique_notes.size, self.bins.size - 1), dtype=int)
+        np.add.at(hists, (note_index, bin_index), 1)
+        over = np.zeros((unique_notes.size, self.thresholds.size), dtype=int)
+        np.add.at(over, note_index, np.abs(delta)[:, np.newaxis] > self.thresholds)
+        max_abs = np.zeros(unique_notes.size)
+        np.maximum.at(max_abs, note_index, np.abs(delta))
+
+        for i, note in enumerate(unique_notes):
+            if note in self.hists:
+                self.hists[note] += hists[i]
+                self.n_over[note] += over[i]
+                self.max_abs[note] = max(self.max_abs[note], max_abs[i])
+            else:
+                self.hists[note] = hists[i]
+                self.n_over[note] = over[i]
+                self.max_abs[note] = max_abs[i]
+
+    def summary(self, min_threshold_count=1):
+        """Lines summarizing notes with rotator moves over the thresholds
+
+        Parameters
+        ----------
+        min_threshold_count : `int`
+            Only list notes with at least this many moves over the
+            smallest threshold. Default 1.
+
+        Returns
+        -------
+        summary : `str`
+        """
+        header = "%-30s %8s %8s " % ("scheduler_note", "n", "max") + " ".join(
+            [">%g" % threshold for threshold in self.thresholds]
+        )
+        lines = [header]
+        for note in sorted(self.hists, key=lambda key: -self.n_over[key][0]):
+            if self.n_over[note][0] < min_threshold_count:
+                continue
+            lines.append(
+                "%-30s %8i %8.1f " % (note, self.hists[note].sum(), self.max_abs[note])
+                + " ".join(["%i" % count for count in self.n_over[note]])
+            )
+        return "\n".join(lines)
+
+    def save(self, filename):
+        """Save the histograms to an npz file
+
+        Arrays are notes, bins, hists (one row per note), n_over
+        (one column per threshold), thresholds and max_abs.
+        """
+        notes = np.array(sorted(self.hists.keys()))
+        np.savez(
+            filename,
+            notes=notes,
+            bins=self.bins,
+            hists=np.array([self.hists[note] for note in notes]).reshape(notes.size, self.bins.size - 1),
+            n_over=np.array([self.n_over[note] for note in notes]).reshape(notes.size, self.thresholds.size),
+            thresholds=self.thresholds,
+            max_abs=np.array([self.max_abs[note] for note in notes]),
+        )
@@ -0,0 +1,76 @@
+# Find visits where the sky background would saturate (or come close),
+# for any number of runs in parallel, reading each database in chunks.
+
+import argparse
+from multiprocessing import Pool
+
+import numpy as np
+
+from obs_io import iter_observations, sky_counts
+
+COLUMNS = ["skyBrightness", "visitExposureTime", "numExposures", "filter", "scheduler_note"]
+
+
+def check_run(filename, zeropoints, count_limit=30000.0, pixscale=0.2, chunk_size=100000):
+    """Sky count summary for one run
+
+    Returns
+    -------
+    result : `dict`
+        Number of visits, max sky counts, number of visits over
+        count_limit, and the count of over-limit visits per
+        scheduler_note that are not ToOs.
+    """
+    n_visits = 0
+    max_counts = 0.0
+    n_over = 0
+    non_too = {}
+    for chunk in iter_observations(filename, columns=COLUMNS, chunk_size=chunk_size):
+        counts = sky_counts(
+            chunk["skyBrightness"],
+            chunk["visitExposureTime"] / chunk["numExposures"],
+            chunk["filter"],
+            zeropoints,
+            pixscale=pixscale,
+        )
+        n_visits += chunk.size
+        max_counts = max(max_counts, np.nanmax(counts))
+        over = np.where(counts > count_limit)[0]
+        n_over += over.size
+        notes, note_counts = np.unique(chunk["scheduler_note"][over].astype(str), return_counts=True)
+        for note, count in zip(notes, note_counts):
+            if "ToO" not in note:
+                non_too[str(note)] = non_too.get(str(note), 0) + int(count)
+    return {
+        "filename": filename,
+        "n_visits": n_visits,
+        "max_counts": max_counts,
+        "n_over": n_over,
+        "non_too": non_too,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("dbs", type=str, nargs="+", help="Run databases (or parquet files) to check")
+    parser.add_argument("--count_limit", type=float, default=30000.0)
+    parser.add_argument("--pixscale", type=float, default=0.2)
+    parser.add_argument("--n_proc", type=int, default=None, help="Default all cores")
+    args = parser.parse_args()
+
+    from rubin_sim.maf.utils import load_inst_zeropoints
+
+    zeropoints, _k_atm = load_inst_zeropoints()
+
+    with Pool(args.n_proc) as pool:
+        results = pool.starmap(
+            check_run, [(filename, zeropoints, args.count_limit, args.pixscale) for filename in args.dbs]
+        )
+
+    for result in results:
+        print(
+            "%s: %i visits, max sky counts %.0f, %i over %.0f"
+            % (result["filename"], result["n_visits"], result["max_counts"], result["n_over"], args.count_limit)
+        )
+        for note, count in result["non_too"].items():
+            print("    non-ToO: %s (%i)" % (note, count))
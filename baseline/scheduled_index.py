@@ -0,0 +1,82 @@
+# A sorted index of the scheduled (scripted) observation times across
+# all surveys, so finding the next scheduled observation is a binary
+# search rather than a concatenate and sort on every decision.
+
+__all__ = ("ScheduledObsIndex", "TimeToNextScheduledBasisFunction")
+
+import numpy as np
+
+import rubin_scheduler.scheduler.basis_functions as bf
+
+
+class ScheduledObsIndex:
+    """Sorted times of the scheduled observations of a set of surveys
+
+    Surveys publish their scheduled observation times through
+    get_scheduled_obs, and replace (rather than modify) that array
+    when their script changes. The index keeps a reference to each
+    survey's array and only re-sorts when one of them has been
+    replaced, which is rare (e.g., a ToO arriving or a long gap
+    being scripted).
+    """
+
+    def __init__(self):
+        self.sources = []
+        self.times = np.array([])
+        self.n_rebuilds = 0
+
+    def update(self, scheduled):
+        """Update the index from the scheduled observations of each survey
+
+        Parameters
+        ----------
+        scheduled : `list`
+            The result of get_scheduled_obs for each survey, in a
+            fixed survey order (None for no scheduled observations).
+
+        Returns
+        -------
+        rebuilt : `bool`
+            True if the index had to be re-sorted.
+        """
+        if (len(scheduled) == len(self.sources)) and all(
+            [new is old for new, old in zip(scheduled, self.sources)]
+        ):
+            return False
+        self.sources = list(scheduled)
+        arrays = [np.atleast_1d(times).ravel() for times in scheduled if times is not None]
+        if len(arrays) == 0:
+            self.times = np.array([])
+        else:
+            self.times = np.sort(np.concatenate(arrays))
+            self.times = self.times[~np.isnan(self.times)]
+        self.n_rebuilds += 1
+        return True
+
+    def pending(self, mjd):
+        """Sorted scheduled times at or after mjd (a view, not a copy)
+
+        Returns an empty list if no survey has scheduled observations,
+        to match CoreScheduler.
+        """
+        if len(self.sources) == 0 or all([times is None for times in self.sources]):
+            return []
+        return self.times[np.searchsorted(self.times, mjd, side="left") :]
+
+
+class TimeToNextScheduledBasisFunction(bf.TimeToScheduledBasisFunction):
+    """`TimeToScheduledBasisFunction` that relies on scheduled_observations
+    being sorted (as CoreScheduler and `ScheduledObsIndex` provide), so
+    the next scheduled observation is the first rather than the min.
+
+    Parameters
+    ----------
+    time_needed : `float`
+        The time needed to run a survey (minutes). Default 30.
+    """
+
+    def check_feasibility(self, conditions):
+        if len(conditions.scheduled_observations) == 0:
+            return True
+        available_time = conditions.scheduled_observations[0] - conditions.mjd
+        return available_time > self.time_needed
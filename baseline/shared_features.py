@@ -0,0 +1,275 @@
+# Share survey features that several surveys maintain identically, so
+# each is updated once per visit, and share the per-pixel season
+# weights that the template basis functions compute.
+
+__all__ = (
+    "SharedFeatureView",
+    "season_weights",
+    "SharedNObsPerYearBasisFunction",
+    "use_shared_season_weights",
+    "feature_key",
+    "share_features",
+    "count_feature_updates",
+)
+
+import hashlib
+
+import numpy as np
+
+import rubin_scheduler.scheduler.basis_functions as bf
+import rubin_scheduler.scheduler.features as features
+from rubin_scheduler.scheduler.surveys import BaseSurvey
+from rubin_scheduler.scheduler.utils import IntRounded
+
+# Basis function methods that pass observations straight to the features
+_BF_ADD = (bf.BaseBasisFunction.add_observation, bf.BaseBasisFunction.add_observations_array)
+
+
+class SharedFeatureView:
+    """Stands in for a survey feature kept up to date by an identical one
+
+    Reads (feature, season_update, ...) go to the source feature.
+    Adding observations does nothing, the source's own basis function
+    adds them.
+
+    Parameters
+    ----------
+    source : `rubin_scheduler.scheduler.features.BaseSurveyFeature`
+        The feature that is updated.
+    """
+
+    def __init__(self, source):
+        self.source = source
+
+    def __getattr__(self, name):
+        # Guard against recursion before source is set (e.g., when copying)
+        if name == "source":
+            raise AttributeError(name)
+        return getattr(self.source, name)
+
+    def add_observation(self, observation, indx=None, **kwargs):
+        pass
+
+    def add_observations_array(self, observations_array, observations_hpid):
+        pass
+
+
+def season_weights(conditions, season_start_hour, season_end_hour):
+    """Per-pixel weight for how far into its observing season each pixel is
+
+    This is the relative RA ramp of `NObsPerYearBasisFunction`, cached
+    on the conditions for the current sun RA, so it is computed once
+    per decision rather than once per basis function.
+
+    Parameters
+    ----------
+    conditions : `rubin_scheduler.scheduler.features.Conditions`
+        The current conditions.
+    season_start_hour, season_end_hour : `float`
+        Season limits, relative to RA 180 degrees from the sun (radians).
+
+    Returns
+    -------
+    weight : `np.ndarray`
+        Do not modify, the array is shared.
+    """
+    # conditions.ra is fixed for a Conditions object, only the sun moves
+    cache = conditions.__dict__.setdefault("_season_weights", {})
+    key = (season_start_hour, season_end_hour)
+    cached = cache.get(key)
+    if cached is not None and cached[0] == conditions.sun_ra:
+        return cached[1]
+
+    mid_season_ra = (conditions.sun_ra + np.pi) % (2.0 * np.pi)
+    relative_ra = (conditions.ra - mid_season_ra) % (2.0 * np.pi)
+    relative_ra = (season_end_hour - relative_ra) % (2.0 * np.pi)
+    relative_ra[np.where(IntRounded(relative_ra) > IntRounded(season_end_hour - season_start_hour))] = 0
+    weight = relative_ra / (season_end_hour - season_start_hour)
+    cache[key] = (conditions.sun_ra, weight)
+    return weight
+
+
+class SharedNObsPerYearBasisFunction(bf.NObsPerYearBasisFunction):
+    """`NObsPerYearBasisFunction` using the shared `season_weights`
+
+    Takes the same parameters as `NObsPerYearBasisFunction`.
+    """
+
+    def _calc_value(self, conditions, indx=None):
+        if conditions.night > self.night_max:
+            return 0
+
+        result = self.result.copy()
+        behind_pix = np.where((conditions.mjd - self.survey_features["last_n_mjds"].feature[0]) > self.season)
+        result[behind_pix] = 1
+        result *= season_weights(conditions, self.season_start_hour, self.season_end_hour)
+        # mask off anything outside the footprint
+        result[self.out_footprint] = 0
+
+        return result
+
+
+class _NotShareable(Exception):
+    pass
+
+
+def _fingerprint(value):
+    """Hashable summary of a feature attribute (raises _NotShareable)"""
+    if value is None or isinstance(value, (bool, int, str, np.integer, np.bool_, np.str_)):
+        return value
+    if isinstance(value, (float, np.floating)):
+        # So NaN parameters match
+        return "nan" if np.isnan(value) else float(value)
+    if isinstance(value, np.ndarray):
+        if value.dtype.hasobject:
+            raise _NotShareable()
+        digest = hashlib.sha1(np.ascontiguousarray(value).tobytes()).hexdigest()
+        return ("ndarray", str(value.dtype), value.shape, digest)
+    if isinstance(value, (list, tuple)):
+        return (type(value).__name__,) + tuple([_fingerprint(val) for val in value])
+    if isinstance(value, dict):
+        return ("dict",) + tuple([(key, _fingerprint(value[key])) for key in sorted(value)])
+    if isinstance(value, IntRounded):
+        return ("IntRounded", _fingerprint(value.initial), value.scale)
+    if isinstance(value, features.BaseSurveyFeature):
+        return (type(value), _fingerprint(vars(value)))
+    # Anything else could be shared with (or updated from) outside
+    raise _NotShareable()
+
+
+def feature_key(feature):
+    """What makes two survey features identical (None if not shareable)
+
+    Two features are identical if they have the same class and all their
+    attributes (parameters and current state) are equal. Arrays are
+    compared by content. Features holding anything else (e.g., a
+    reference to another object) are not shared.
+    """
+    if not isinstance(feature, features.BaseSurveyFeature):
+        return None
+    try:
+        return (type(feature), _fingerprint(vars(feature)))
+    except _NotShareable:
+        return None
+
+
+def use_shared_season_weights(survey_lists):
+    """Switch NObsPerYearBasisFunction objects to
+    `SharedNObsPerYearBasisFunction`, which adds no state
+
+    Returns
+    -------
+    n_switched : `int`
+        Number of basis functions switched.
+    """
+    n_switched = 0
+    for surveys in survey_lists:
+        for survey in surveys:
+            for basis_function in list(survey.extra_basis_functions.values()) + list(survey.basis_functions):
+                if type(basis_function) is bf.NObsPerYearBasisFunction:
+                    basis_function.__class__ = SharedNObsPerYearBasisFunction
+                    n_switched += 1
+    return n_switched
+
+
+def _plain_surveys(survey_lists):
+    """Surveys that pass observations straight to their basis functions"""
+    for surveys in survey_lists:
+        for survey in surveys:
+            if (type(survey).add_observation is BaseSurvey.add_observation) and (
+                type(survey).add_observations_array is BaseSurvey.add_observations_array
+            ):
+                yield survey
+
+
+def _feature_dicts(survey):
+    """The survey's feature dicts that are updated with every visit
+    the survey does not ignore"""
+    yield survey.extra_features
+    for basis_function in list(survey.extra_basis_functions.values()) + list(survey.basis_functions):
+        if (type(basis_function).add_observation, type(basis_function).add_observations_array) == _BF_ADD:
+            yield basis_function.survey_features
+
+
+def share_features(survey_lists, feature_key=feature_key):
+    """Make identical features across surveys share one copy
+
+    Features are identical if feature_key matches, and they belong to
+    surveys that ignore the same observations. The first one found
+    keeps being updated; the others are replaced with a
+    `SharedFeatureView` of it, so each distinct feature is updated
+    once per visit. Should be called before any observations are
+    added (though identical state is part of the default key).
+
+    Only features of surveys and basis functions that pass every
+    observation they don't ignore straight to their features are
+    shared (e.g., not those of scripted surveys, or basis functions
+    that filter on airmass).
+
+    Parameters
+    ----------
+    survey_lists : `list` [`list`]
+        Tiers of surveys, as in `CoreScheduler.survey_lists`.
+    feature_key : callable
+        Returns the key that identifies identical features, or None
+        for features that should not be shared. Default `feature_key`.
+
+    Returns
+    -------
+    n_shared : `int`
+        Number of features replaced by views.
+    """
+    feature_dicts = [
+        (survey, survey_features)
+        for survey in _plain_surveys(survey_lists)
+        for survey_features in _feature_dicts(survey)
+    ]
+    # Basis functions (or features) used by more than one survey get
+    # every visit any of their surveys accepts, so can't stand in for
+    # (or be) a copy
+    n_uses = {}
+    for survey, survey_features in feature_dicts:
+        for obj in [survey_features] + list(survey_features.values()):
+            n_uses[id(obj)] = n_uses.get(id(obj), 0) + 1
+
+    sources = {}
+    n_shared = 0
+    for survey, survey_features in feature_dicts:
+        if n_uses[id(survey_features)] > 1:
+            continue
+        for name, feature in survey_features.items():
+            if isinstance(feature, SharedFeatureView) or n_uses[id(feature)] > 1:
+                continue
+            key = feature_key(feature)
+            if key is None:
+                continue
+            key = key + (tuple(survey.ignore_obs),)
+            if key in sources:
+                survey_features[name] = SharedFeatureView(sources[key])
+                n_shared += 1
+            else:
+                sources[key] = feature
+    return n_shared
+
+
+def count_feature_updates(survey_lists):
+    """Number of features (not views) that surveys keep up to date
+
+    A rough measure of the cost of broadcasting an observation.
+    """
+    n_features = 0
+    for surveys in survey_lists:
+        for survey in surveys:
+            feature_dicts = [survey.extra_features] + [
+                basis_function.survey_features
+                for basis_function in list(survey.extra_basis_functions.values()) + list(survey.basis_functions)
+            ]
+            for survey_features in feature_dicts:
+                n_features += len(
+                    [
+                        feature
+                        for feature in survey_features.values()
+                        if not isinstance(feature, SharedFeatureView)
+                    ]
+                )
+    return n_features
@@ -0,0 +1,183 @@
+# Cache the simulated ToO events on disk, so runs don't regenerate
+# them, and serve the event footprints only while events are active.
+
+__all__ = ("too_cache_files", "cache_too_events", "CachedTargetooServer", "load_too_events")
+
+import os
+
+import healpy as hp
+import numpy as np
+
+import rubin_scheduler
+from rubin_scheduler.scheduler.targetofo import gen_all_events
+from rubin_scheduler.scheduler.utils import TargetoO
+from rubin_scheduler.utils import DEFAULT_NSIDE
+
+from obs_io import atomic_save
+
+
+def too_cache_files(scale=1.0, nside=DEFAULT_NSIDE, cache_dir="."):
+    """Filenames of the cached event table and footprints
+
+    gen_all_events has no seed argument (each event type uses its own
+    fixed seed), so the cache is keyed on the rubin_scheduler version
+    instead, in case the generators change.
+
+    Returns
+    -------
+    filenames : `dict`
+        Filenames for "table", "hpids" and "offsets".
+    """
+    root = os.path.join(
+        cache_dir, "too_events_scale%g_nside%i_rs%s" % (scale, nside, rubin_scheduler.__version__)
+    )
+    return {name: "%s_%s.npy" % (root, name) for name in ["table", "hpids", "offsets"]}
+
+
+def cache_too_events(scale=1.0, nside=DEFAULT_NSIDE, cache_dir="."):
+    """Generate the ToO events and save them to the cache
+
+    Footprints are all 0 or 1, so they are stored sparsely: the
+    HEALpix ids inside each footprint, concatenated, with offsets
+    giving where each event's ids start.
+
+    Returns
+    -------
+    filenames : `dict`
+        See `too_cache_files`.
+    """
+    filenames = too_cache_files(scale=scale, nside=nside, cache_dir=cache_dir)
+    sim_to_o, event_table = gen_all_events(scale=scale, nside=nside)
+    hpids = [np.where(too.footprint > 0)[0] for too in sim_to_o.targeto_o_list]
+    offsets = np.concatenate([[0], np.cumsum([ids.size for ids in hpids])])
+    arrays = {"table": event_table, "hpids": np.concatenate(hpids).astype(np.int32), "offsets": offsets}
+
+    os.makedirs(cache_dir, exist_ok=True)
+    # Table last, it marks the cache as complete
+    for name in ["hpids", "offsets", "table"]:
+        atomic_save(filenames[name], arrays[name])
+    return filenames
+
+
+class CachedTargetooServer:
+    """Deliver cached ToO events at the right time
+
+    Drop-in replacement for
+    `rubin_scheduler.scheduler.utils.SimTargetooServer`. Footprints are
+    memory mapped from the cache and only expanded into full HEALpix
+    maps shortly before events start. Events are dropped once expired,
+    so only a handful of footprints are resident at any time.
+
+    Parameters
+    ----------
+    event_table : `np.ndarray`
+        Event table, as returned by `gen_all_events`.
+    hpids : `np.ndarray`
+        Concatenated HEALpix ids of the event footprints.
+    offsets : `np.ndarray`
+        Start of each event's ids in hpids (length n_events + 1).
+    nside : `int`
+        HEALpix nside of the footprints.
+    lookahead : `float`
+        Page in events starting within this many days. Default 1.
+    """
+
+    def __init__(self, event_table, hpids, offsets, nside=DEFAULT_NSIDE, lookahead=1.0):
+        self.event_table = event_table
+        self.hpids = hpids
+        self.offsets = offsets
+        self.npix = hp.nside2npix(nside)
+        self.lookahead = lookahead
+        # Events come sorted by start time from gen_all_events
+        self.mjd_starts = event_table["mjd_start"]
+        self.mjd_ends = event_table["expires"]
+
+        self.resident = {}
+        self.next_event = 0
+        self.last_mjd = -np.inf
+        self.max_resident = 0
+
+    def targeto_o(self, i):
+        """Make the TargetoO object for event i"""
+        footprint = np.zeros(self.npix, dtype=float)
+        footprint[self.hpids[self.offsets[i] : self.offsets[i + 1]]] = 1
+        return TargetoO(
+            i,
+            footprint,
+            self.event_table["mjd_start"][i],
+            self.event_table["expires"][i] - self.event_table["mjd_start"][i],
+            ra_rad_center=self.event_table["ra"][i],
+            dec_rad_center=self.event_table["dec"][i],
+            too_type=self.event_table["ToO_label"][i],
+        )
+
+    def page(self, mjd):
+        """Load events starting before mjd + lookahead, drop expired ones"""
+        if mjd < self.last_mjd:
+            # Stepped back in time, start paging over
+            self.resident = {}
+            self.next_event = 0
+        self.last_mjd = mjd
+
+        for tooid in [tooid for tooid in self.resident if self.mjd_ends[tooid] <= mjd]:
+            del self.resident[tooid]
+
+        last_event = np.searchsorted(self.mjd_starts, mjd + self.lookahead, side="left")
+        if last_event > self.next_event:
+            new = np.arange(self.next_event, last_event)
+            for tooid in new[np.where(self.mjd_ends[new] > mjd)[0]]:
+                self.resident[tooid] = self.targeto_o(tooid)
+            self.next_event = last_event
+        self.max_resident = max(self.max_resident, len(self.resident))
+
+    def memory_report(self):
+        """Summary of how many footprints have been resident"""
+        return "ToO footprints: max %i of %i events resident (%.1f of %.1f MB)" % (
+            self.max_resident,
+            self.mjd_starts.size,
+            self.max_resident * self.npix * 8 / 1024.0**2,
+            self.mjd_starts.size * self.npix * 8 / 1024.0**2,
+        )
+
+    def __call__(self, mjd):
+        self.page(mjd)
+        result = [
+            self.resident[tooid]
+            for tooid in sorted(self.resident)
+            if (mjd > self.mjd_starts[tooid]) & (mjd < self.mjd_ends[tooid])
+        ]
+        if len(result) == 0:
+            result = None
+        return result
+
+
+def load_too_events(scale=1.0, nside=DEFAULT_NSIDE, cache_dir=".", lookahead=1.0):
+    """Cached equivalent of `gen_all_events`
+
+    Parameters
+    ----------
+    scale : `float`
+        Amount to scale the total number of events. Default 1.
+    nside : `int`
+        HEALpix nside. Default DEFAULT_NSIDE.
+    cache_dir : `str`
+        Directory holding the cached events. Default ".".
+    lookahead : `float`
+        Days ahead to page in event footprints. Default 1.
+
+    Returns
+    -------
+    sim_to_o : `CachedTargetooServer`
+        ToO server to pass to the ModelObservatory.
+    event_table : `np.ndarray`
+        Event table, to pass to sim_runner.
+    """
+    if scale == 0:
+        return None, None
+    filenames = too_cache_files(scale=scale, nside=nside, cache_dir=cache_dir)
+    if not os.path.isfile(filenames["table"]):
+        filenames = cache_too_events(scale=scale, nside=nside, cache_dir=cache_dir)
+    event_table = np.load(filenames["table"])
+    hpids = np.load(filenames["hpids"], mmap_mode="r")
+    offsets = np.load(filenames["offsets"])
+    return CachedTargetooServer(event_table, hpids, offsets, nside=nside, lookahead=lookahead), event_table
@@ -0,0 +1,118 @@
+# Run the same commandfile used with write_slurm.py --array on a single
+# machine, through a local pool of workers. Each run gets its own
+# output-out-<n>.txt and output-err-<n>.txt log (n is the line number of
+# the run in the commandfile), and failed runs are retried.
+
+import argparse
+import datetime
+import os
+import socket
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from write_slurm import read_commands
+
+_write_lock = threading.Lock()
+
+
+def run_command(command, run_id, log_root="output", workdir=".", retries=1, record_rss=None):
+    """Run one command, retrying on a non-zero exit
+
+    Parameters
+    ----------
+    command : `str`
+        Shell command to run.
+    run_id : `int`
+        Used to name the log files.
+    log_root : `str`
+        Log files are log_root-out-<run_id>.txt and log_root-err-<run_id>.txt.
+    workdir : `str`
+        Directory to run in (and write logs to).
+    retries : `int`
+        Number of extra attempts after a failure. Default 1.
+    record_rss : `str`
+        If set, append the peak RSS (kB) and command to this file,
+        in the format read by write_slurm.py --rss_profile.
+
+    Returns
+    -------
+    returncode : `int`
+        Exit code of the last attempt.
+    """
+    env = os.environ.copy()
+    # Match the slurm scripts, one thread per run
+    env["OPENBLAS_NUM_THREADS"] = "1"
+
+    out_name = os.path.join(workdir, f"{log_root}-out-{run_id}.txt")
+    err_name = os.path.join(workdir, f"{log_root}-err-{run_id}.txt")
+    with open(out_name, "w") as out, open(err_name, "w") as err:
+        for attempt in range(retries + 1):
+            out.write(f"Job starting at {datetime.datetime.now()} (attempt {attempt + 1})\n")
+            out.write(f"Job running on {socket.gethostname()}\n")
+            out.flush()
+            process = subprocess.Popen(command, shell=True, cwd=workdir, env=env, stdout=out, stderr=err)
+            # wait4 rather than wait, to get this child's resource usage
+            _pid, status, rusage = os.wait4(process.pid, 0)
+            process.returncode = os.waitstatus_to_exitcode(status)
+            out.write(f"Job ending at {datetime.datetime.now()}, exit code {process.returncode}\n")
+            out.flush()
+            if record_rss is not None:
+                with _write_lock:
+                    with open(record_rss, "a") as f:
+                        f.write(f"{rusage.ru_maxrss} {command}\n")
+            if process.returncode == 0:
+                break
+    return process.returncode
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-f",
+        "--commandfile",
+        type=str,
+        dest="commandfile",
+        help="file with one run per line, as for write_slurm.py --array",
+        required=True,
+    )
+    parser.add_argument(
+        "-n", "--ntasks", type=int, dest="ntasks", help="number of runs at once", default=os.cpu_count()
+    )
+    parser.add_argument("-d", "--dir", type=str, dest="dir", default=None)
+    parser.add_argument("-j", "--jobname", type=str, dest="jobname", help="log file root", default=None)
+    parser.add_argument("--retries", type=int, default=1, help="extra attempts for a failed run")
+    parser.add_argument(
+        "--record_rss",
+        type=str,
+        default=None,
+        help="append peak RSS of each run to this file (for write_slurm.py --rss_profile)",
+    )
+    args = parser.parse_args()
+
+    if args.dir is None:
+        args.dir = os.getcwd()
+    log_root = "output" if args.jobname is None else args.jobname
+
+    commands = read_commands(args.commandfile)
+    print(f"Running {len(commands)} commands, {args.ntasks} at a time")
+    # Runs are separate processes, so threads are enough to keep the queue full
+    with ThreadPoolExecutor(max_workers=args.ntasks) as executor:
+        futures = [
+            executor.submit(
+                run_command,
+                command,
+                i,
+                log_root=log_root,
+                workdir=args.dir,
+                retries=args.retries,
+                record_rss=args.record_rss,
+            )
+            for i, command in enumerate(commands)
+        ]
+        returncodes = [future.result() for future in futures]
+
+    failed = [i for i, code in enumerate(returncodes) if code != 0]
+    for i in failed:
+        print(f"Failed (exit {returncodes[i]}): {commands[i]}, see {log_root}-err-{i}.txt")
+    print(f"{len(commands) - len(failed)} of {len(commands)} runs succeeded")
@@ -0,0 +1,223 @@
+# Vectorized jerk-limited slew time kernel for the TMA. Evaluates
+# slew times to every target (and optionally every TMA setting)
+# in one set of array operations.
+
+__all__ = ("jerk_limited_time", "tma_slew_times")
+
+import argparse
+import time
+
+import healpy as hp
+import numpy as np
+
+from rubin_scheduler.scheduler.model_observatory import KinemModel, tma_movement
+from rubin_scheduler.scheduler.model_observatory.jerk import jerk_time
+from rubin_scheduler.utils import SURVEY_START_MJD
+
+two_pi = 2.0 * np.pi
+
+
+def jerk_limited_time(distance, v_max, acc_max, jerk_max=None):
+    """Time to move a distance with symmetric velocity, acceleration
+    and jerk limits, starting and ending at rest.
+
+    Same motion profile as
+    `rubin_scheduler.scheduler.model_observatory.jerk.jerk_time`, but
+    evaluated branch-free so all inputs broadcast against each other
+    (e.g., distances of shape (npix,) with limits of shape (nsettings, 1)).
+
+    Parameters
+    ----------
+    distance : `np.ndarray`
+        Distance to travel.
+    v_max : `float` or `np.ndarray`
+        Maximum velocity (distance per second).
+    acc_max : `float` or `np.ndarray`
+        Maximum acceleration (distance per second**2).
+    jerk_max : `float`, `np.ndarray` or None
+        Maximum jerk (distance per second**3). None treats
+        jerk as infinite. Default None.
+
+    Returns
+    -------
+    move_time : `np.ndarray`
+        Time to complete the move (seconds).
+    """
+    distance = np.abs(np.asarray(distance, dtype=float))
+    v_max = np.asarray(v_max, dtype=float)
+    acc_max = np.asarray(acc_max, dtype=float)
+    if jerk_max is None:
+        jerk_max = np.inf
+    jerk_max = np.asarray(jerk_max, dtype=float)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # Profile that reaches v_max. Acceleration may top out
+        # below acc_max if the jerk limit is low.
+        acc_peak = np.minimum(acc_max, np.sqrt(v_max * jerk_max))
+        t_jerk = acc_peak / jerk_max
+        # Time to get up to v_max
+        t_acc = t_jerk + v_max / acc_peak
+        dist_v = v_max * t_acc
+        time_v = t_acc + distance / v_max
+
+        # Reaches acc_max, but not v_max
+        t_jerk_a = acc_max / jerk_max
+        t_const_a = 0.5 * (np.sqrt(t_jerk_a**2 + 4.0 * distance / acc_max) - 3.0 * t_jerk_a)
+        time_a = 4.0 * t_jerk_a + 2.0 * t_const_a
+        dist_a = 2.0 * acc_max**3 / jerk_max**2
+
+        # Reaches neither
+        time_j = 4.0 * np.cbrt(distance / (2.0 * jerk_max))
+
+    result = np.where(distance >= dist_v, time_v, np.where(distance >= dist_a, time_a, time_j))
+    return result
+
+
+def tma_slew_times(
+    alt_rad,
+    az_rad,
+    starting_alt_rad,
+    starting_az_rad,
+    tma,
+    cumulative_azimuth_rad=0.0,
+    azimuth_minpos=-250.0,
+    azimuth_maxpos=250.0,
+):
+    """Telescope mount slew times from one position to many targets
+
+    Only the TMA motion and settle are modeled (no dome, optics,
+    rotator or filter change), using the same short/long azimuth
+    cable wrap logic as `KinemModel.slew_times`.
+
+    Parameters
+    ----------
+    alt_rad, az_rad : `np.ndarray`
+        Target altitudes and azimuths (radians).
+    starting_alt_rad, starting_az_rad : `float`
+        Starting altitude and azimuth (radians).
+    tma : `dict`
+        TMA settings, as returned by `tma_movement` (degrees, seconds).
+        Values can be arrays (e.g., shape (nsettings, 1)) to evaluate
+        several settings at once.
+    cumulative_azimuth_rad : `float`
+        Current cumulative (cable wrap) azimuth (radians). Default 0.
+    azimuth_minpos, azimuth_maxpos : `float`
+        Cumulative azimuth limits (degrees). Default -250, 250.
+
+    Returns
+    -------
+    slew_time : `np.ndarray`
+        Slew times (seconds). NaN where the cable wrap
+        prevents reaching the target.
+    """
+    delta_alt = np.abs(alt_rad - starting_alt_rad)
+
+    delta_az_short = (az_rad - starting_az_rad + np.pi) % two_pi - np.pi
+    delta_az_long = np.where(delta_az_short < 0, two_pi + delta_az_short, delta_az_short - two_pi)
+    az_min = np.radians(azimuth_minpos)
+    az_max = np.radians(azimuth_maxpos)
+    short_ok = (cumulative_azimuth_rad + delta_az_short >= az_min) & (
+        cumulative_azimuth_rad + delta_az_short <= az_max
+    )
+    long_ok = (cumulative_azimuth_rad + delta_az_long >= az_min) & (
+        cumulative_azimuth_rad + delta_az_long <= az_max
+    )
+    delta_az_short = np.where(short_ok, np.abs(delta_az_short), np.inf)
+    delta_az_long = np.where(long_ok, np.abs(delta_az_long), np.inf)
+    delta_az = np.minimum(delta_az_short, delta_az_long)
+
+    alt_time = jerk_limited_time(
+        np.degrees(delta_alt), tma["altitude_maxspeed"], tma["altitude_accel"], tma["altitude_jerk"]
+    )
+    az_time = jerk_limited_time(
+        np.degrees(delta_az), tma["azimuth_maxspeed"], tma["azimuth_accel"], tma["azimuth_jerk"]
+    )
+    slew_time = np.maximum(alt_time, az_time)
+    slew_time = np.where(slew_time > 0, slew_time + np.asarray(tma["settle_time"]), slew_time)
+    return np.where(np.isfinite(slew_time), slew_time, np.nan)
+
+
+def _time_it(func, n_repeat):
+    t0 = time.perf_counter()
+    for i in range(n_repeat):
+        result = func()
+    return result, (time.perf_counter() - t0) / n_repeat
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the vectorized TMA slew time kernel")
+    parser.add_argument("--nside", type=int, default=32)
+    parser.add_argument("--percent", type=float, nargs="+", default=[40.0, 70.0, 100.0])
+    parser.add_argument("--n_repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    npix = hp.nside2npix(args.nside)
+    theta, phi = hp.pix2ang(args.nside, np.arange(npix))
+    alt = np.pi / 2.0 - theta
+    az = phi
+    up = np.where((alt > np.radians(20.0)) & (alt < np.radians(86.5)))[0]
+    alt, az = alt[up], az[up]
+    starting_alt_rad = np.radians(75.0)
+    starting_az_rad = np.radians(75.0)
+
+    for percent in args.percent:
+        tma = tma_movement(percent)
+        kinematic_model = KinemModel(mjd0=SURVEY_START_MJD)
+        kinematic_model.setup_telescope(**tma)
+
+        def scalar_path():
+            return np.array(
+                [
+                    kinematic_model.slew_times(
+                        None,
+                        None,
+                        SURVEY_START_MJD,
+                        filtername=None,
+                        alt_rad=np.array([alt_1]),
+                        az_rad=np.array([az_1]),
+                        starting_alt_rad=starting_alt_rad,
+                        starting_az_rad=starting_az_rad,
+                    )[0]
+                    for alt_1, az_1 in zip(alt, az)
+                ]
+            )
+
+        def kinem_path():
+            return kinematic_model.slew_times(
+                None,
+                None,
+                SURVEY_START_MJD,
+                filtername=None,
+                alt_rad=alt,
+                az_rad=az,
+                starting_alt_rad=starting_alt_rad,
+                starting_az_rad=starting_az_rad,
+            )
+
+        def kernel_path():
+            return tma_slew_times(alt, az, starting_alt_rad, starting_az_rad, tma)
+
+        _scalar, t_scalar = _time_it(scalar_path, 1)
+        _kinem, t_kinem = _time_it(kinem_path, args.n_repeat)
+        _kernel, t_kernel = _time_it(kernel_path, args.n_repeat)
+
+        # Check the motion profile against the rubin_scheduler implementation
+        distances = np.degrees(np.abs(alt - starting_alt_rad))
+        reference = jerk_time(distances, tma["altitude_maxspeed"], tma["altitude_accel"], tma["altitude_jerk"])
+        ours = jerk_limited_time(
+            distances, tma["altitude_maxspeed"], tma["altitude_accel"], tma["altitude_jerk"]
+        )
+
+        print("TMA %i%%, %i targets" % (percent, alt.size))
+        print("  per-target KinemModel.slew_times: %.4f s" % t_scalar)
+        print("  vectorized KinemModel.slew_times: %.6f s" % t_kinem)
+        print("  tma_slew_times kernel:            %.6f s" % t_kernel)
+        print("  max |kernel - jerk_time| = %.2e s" % np.max(np.abs(ours - reference)))
+
+    # All requested settings in a single call
+    tmas = [tma_movement(percent) for percent in args.percent]
+    tma_grid = {key: np.array([val[key] for val in tmas])[:, np.newaxis] for key in tmas[0]}
+    _grid, t_grid = _time_it(
+        lambda: tma_slew_times(alt, az, starting_alt_rad, starting_az_rad, tma_grid), args.n_repeat
+    )
+    print("%i settings x %i targets in one call: %.6f s" % (len(tmas), alt.size, t_grid))
@@ -0,0 +1,228 @@
+# Build (and cache on disk) a pixel-to-pixel slew time lookup table
+# from a KinemModel, so blob planning can use realistic slew times
+# rather than a hand-set constant.
+
+__all__ = (
+    "slew_table_key",
+    "build_slew_table",
+    "load_slew_table",
+    "lookup_slew_time",
+    "blob_slew_approx",
+)
+
+import argparse
+import hashlib
+import os
+
+import healpy as hp
+import numpy as np
+
+from rubin_scheduler.scheduler.model_observatory import KinemModel, tma_movement
+from rubin_scheduler.utils import SURVEY_START_MJD
+
+# KinemModel attributes that change the slew time between two alt/az points
+KINEM_ATTRS = [
+    "telalt_minpos_rad",
+    "telalt_maxpos_rad",
+    "telaz_minpos_rad",
+    "telaz_maxpos_rad",
+    "telalt_maxspeed_rad",
+    "telalt_accel_rad",
+    "telalt_jerk_rad",
+    "telaz_maxspeed_rad",
+    "telaz_accel_rad",
+    "telaz_jerk_rad",
+    "mount_settletime",
+    "domalt_maxspeed_rad",
+    "domalt_accel_rad",
+    "domalt_jerk_rad",
+    "domaz_maxspeed_rad",
+    "domaz_accel_rad",
+    "domaz_jerk_rad",
+    "domaz_settletime",
+    "optics_ol_slope",
+    "optics_cl_delay",
+    "optics_cl_altlimit",
+    "overhead",
+    "camera_fov",
+]
+
+
+def slew_table_key(kinematic_model, nside=16):
+    """Hash the kinematic model settings that set slew times
+
+    Parameters
+    ----------
+    kinematic_model : `rubin_scheduler.scheduler.model_observatory.KinemModel`
+        The configured kinematic model.
+    nside : `int`
+        HEALpix nside of the alt/az grid. Default 16.
+
+    Returns
+    -------
+    key : `str`
+        Short hex digest that changes if any relevant setting changes.
+    """
+    values = [nside]
+    for attr in KINEM_ATTRS:
+        value = getattr(kinematic_model, attr, None)
+        if value is not None:
+            value = np.round(np.asarray(value, dtype=float), 10).tolist()
+        values.append((attr, value))
+    return hashlib.sha1(repr(values).encode()).hexdigest()[0:12]
+
+
+def build_slew_table(kinematic_model, nside=16, mjd=SURVEY_START_MJD):
+    """Compute slew times between all reachable alt/az HEALpix centers
+
+    Slew times only depend on the alt/az of the start and end points,
+    so the grid is a HEALpix map in (alt, az) rather than (RA, dec).
+    The cable wrap is assumed to be unwound (cumulative azimuth of zero)
+    at the start of every slew, and no filter change or rotator
+    motion is included.
+
+    Parameters
+    ----------
+    kinematic_model : `rubin_scheduler.scheduler.model_observatory.KinemModel`
+        The configured kinematic model.
+    nside : `int`
+        HEALpix nside of the alt/az grid. Default 16.
+    mjd : `float`
+        MJD passed to the kinematic model (only used for
+        alt/az conversions, which are bypassed). Default SURVEY_START_MJD.
+
+    Returns
+    -------
+    table : `dict`
+        Dictionary with keys "nside", "hpids" (the alt/az pixels inside
+        the telescope altitude limits), "hp2row" (map from pixel to
+        row of the table, -1 if unreachable) and "slewtimes" (float32
+        array of shape (hpids.size, hpids.size), seconds).
+    """
+    npix = hp.nside2npix(nside)
+    theta, phi = hp.pix2ang(nside, np.arange(npix))
+    alt = np.pi / 2.0 - theta
+    az = phi
+
+    hpids = np.where(
+        (alt >= kinematic_model.telalt_minpos_rad) & (alt <= kinematic_model.telalt_maxpos_rad)
+    )[0]
+    hp2row = np.zeros(npix, dtype=int) - 1
+    hp2row[hpids] = np.arange(hpids.size)
+
+    slewtimes = np.zeros((hpids.size, hpids.size), dtype=np.float32)
+    for i, hpid in enumerate(hpids):
+        slewtimes[i, :] = kinematic_model.slew_times(
+            None,
+            None,
+            mjd,
+            filtername=None,
+            alt_rad=alt[hpids],
+            az_rad=az[hpids],
+            starting_alt_rad=alt[hpid],
+            starting_az_rad=az[hpid],
+        )
+
+    return {"nside": nside, "hpids": hpids, "hp2row": hp2row, "slewtimes": slewtimes}
+
+
+def load_slew_table(kinematic_model, nside=16, mjd=SURVEY_START_MJD, cache_dir="."):
+    """Load a cached slew table, building and saving it if needed
+
+    Parameters
+    ----------
+    kinematic_model : `rubin_scheduler.scheduler.model_observatory.KinemModel`
+        The configured kinematic model.
+    nside : `int`
+        HEALpix nside of the alt/az grid. Default 16.
+    mjd : `float`
+        MJD passed on to `build_slew_table`. Default SURVEY_START_MJD.
+    cache_dir : `str`
+        Directory to hold the cached tables. Default ".".
+
+    Returns
+    -------
+    table : `dict`
+        See `build_slew_table`.
+    """
+    key = slew_table_key(kinematic_model, nside=nside)
+    filename = os.path.join(cache_dir, "slew_table_nside%i_%s.npz" % (nside, key))
+    if os.path.isfile(filename):
+        with np.load(filename) as data:
+            table = {name: data[name] for name in data.files}
+        table["nside"] = int(table["nside"])
+        return table
+
+    table = build_slew_table(kinematic_model, nside=nside, mjd=mjd)
+    os.makedirs(cache_dir, exist_ok=True)
+    # Write then rename, so parallel runs never read a partial file
+    temp_name = filename + ".%i.tmp.npz" % os.getpid()
+    np.savez(temp_name, **table)
+    os.replace(temp_name, filename)
+    return table
+
+
+def lookup_slew_time(table, alt1, az1, alt2, az2):
+    """Look up slew times between alt/az points
+
+    Parameters
+    ----------
+    table : `dict`
+        Table from `load_slew_table` or `build_slew_table`.
+    alt1, az1 : `np.ndarray` or `float`
+        Starting altitude and azimuth (radians).
+    alt2, az2 : `np.ndarray` or `float`
+        Ending altitude and azimuth (radians).
+
+    Returns
+    -------
+    slewtime : `np.ndarray`
+        Slew times (seconds). NaN where either point is outside
+        the telescope altitude limits.
+    """
+    nside = table["nside"]
+    row1 = table["hp2row"][hp.ang2pix(nside, np.pi / 2.0 - alt1, az1)]
+    row2 = table["hp2row"][hp.ang2pix(nside, np.pi / 2.0 - alt2, az2)]
+    result = table["slewtimes"][row1, row2].astype(float)
+    result = np.where((row1 < 0) | (row2 < 0), np.nan, result)
+    return result
+
+
+def blob_slew_approx(table):
+    """Typical slew time between neighboring fields in a blob
+
+    Blobs are ordered so consecutive visits are on neighboring
+    pointings, so use the median slew time between neighboring
+    alt/az pixels.
+
+    Parameters
+    ----------
+    table : `dict`
+        Table from `load_slew_table` or `build_slew_table`.
+
+    Returns
+    -------
+    slew_approx : `float`
+        Value suitable for the BlobSurvey slew_approx kwarg (seconds).
+    """
+    hpids = table["hpids"]
+    neighbors = hp.get_all_neighbours(table["nside"], hpids).T
+    rows = np.repeat(np.arange(hpids.size), neighbors.shape[1])
+    cols = table["hp2row"][neighbors.ravel()]
+    good = np.where((neighbors.ravel() >= 0) & (cols >= 0))[0]
+    slewtimes = table["slewtimes"][rows[good], cols[good]]
+    return float(np.nanmedian(slewtimes))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--percent", type=float, default=70.0, help="TMA movement percent")
+    parser.add_argument("--nside", type=int, default=16)
+    parser.add_argument("--cache_dir", type=str, default=".")
+    args = parser.parse_args()
+
+    kinematic_model = KinemModel(mjd0=SURVEY_START_MJD)
+    kinematic_model.setup_telescope(**tma_movement(args.percent))
+    table = load_slew_table(kinematic_model, nside=args.nside, cache_dir=args.cache_dir)
+    print("%i reachable alt/az pixels" % table["hpids"].size)
+    print("blob slew_approx = %.2f s" % blob_slew_approx(table))
@@ -44,6 +44,8 @@ from rubin_scheduler.scheduler.utils import ConstantFootprint, CurrentAreaMap, m
 from rubin_scheduler.site_models import Almanac
 from rubin_scheduler.utils import DEFAULT_NSIDE, SURVEY_START_MJD, _hpid2_ra_dec
 
+from slew_table import blob_slew_approx, load_slew_table
+
 # So things don't fail on hyak
 iers.conf.auto_download = False
 # XXX--note this line probably shouldn't be in production
@@ -321,6 +323,7 @@ def blob_for_long(
     blob_names=[],
     u_exptime=38.0,
     scheduled_respect=30.0,
+    slew_approx=7.5,
 ):
     """
     Generate surveys that take observations in blobs.
@@ -377,10 +380,12 @@ def blob_for_long(
     u_nexp1 : bool (True)
         Add a detailer to make sure the number of expossures
         in a visit is always 1 for u observations.
+    slew_approx : float (7.5)
+        Approximate slew time between blob visits (seconds)
     """
 
     BlobSurvey_params = {
-        "slew_approx": 7.5,
+        "slew_approx": slew_approx,
         "filter_change_approx": 140.0,
         "read_approx": 2.0,
         "flush_time": 30.0,
@@ -495,12 +500,15 @@ def gen_long_gaps_survey(
     g_template_weight=50.0,
     u_exptime=38.0,
     nexp=2,
+    slew_approx=7.5,
 ):
     """
     Paramterers
     -----------
     HA_min(_max) : float
         The hour angle limits passed to the initial blob scheduler.
+    slew_approx : float (7.5)
+        Approximate slew time between blob visits (seconds)
     """
 
     surveys = []
@@ -526,6 +534,7 @@ def gen_long_gaps_survey(
             blob_names=blob_names,
             u_exptime=u_exptime,
             nexp=nexp,
+            slew_approx=slew_approx,
         )
         scripted = ScriptedSurvey(
             [bf.AvoidDirectWind(nside=nside)],
@@ -697,6 +706,7 @@ def generate_blobs(
     mjd_start=1,
     repeat_weight=-20,
     u_exptime=38.0,
+    slew_approx=7.5,
 ):
     """
     Generate surveys that take observations in blobs.
@@ -756,10 +766,12 @@ def generate_blobs(
     scheduled_respect : float (45)
         How much time to require there be before a pre-scheduled
         observation (minutes)
+    slew_approx : float (7.5)
+        Approximate slew time between blob visits (seconds)
     """
 
     BlobSurvey_params = {
-        "slew_approx": 7.5,
+        "slew_approx": slew_approx,
         "filter_change_approx": 140.0,
         "read_approx": 2.0,
         "flush_time": 30.0,
@@ -934,6 +946,7 @@ def generate_twi_blobs(
     scheduled_respect=15.0,
     repeat_weight=-1.0,
     night_pattern=None,
+    slew_approx=7.5,
 ):
     """
     Generate surveys that take observations in blobs.
@@ -987,10 +1000,12 @@ def generate_twi_blobs(
         The weight to place on getting image templates in u-band.
         Since there are so few u-visits, it can be helpful to turn
         this up a little higher than the standard template_weight kwarg.
+    slew_approx : float (7.5)
+        Approximate slew time between blob visits (seconds)
     """
 
     BlobSurvey_params = {
-        "slew_approx": 7.5,
+        "slew_approx": slew_approx,
         "filter_change_approx": 140.0,
         "read_approx": 2.0,
         "flush_time": 30.0,
@@ -1379,6 +1394,14 @@ def set_run_info(dbroot=None, file_end="v3.4_", out_dir="."):
     return fileroot, extra_info
 
 
+def gen_kinem_model(mjd_start=60796.0):
+    """Set up the kinematic model with the TMA movement for this run"""
+    kinematic_model = KinemModel(mjd0=mjd_start)
+    tma = tma_movement(40)
+    kinematic_model.setup_telescope(**tma)
+    return kinematic_model
+
+
 def run_sched(
     scheduler,
     survey_length=365.25,
@@ -1395,9 +1418,7 @@ def run_sched(
     n_visit_limit = None
     fs = SimpleFilterSched(illum_limit=illum_limit)
 
-    kinematic_model = KinemModel(mjd0=mjd_start)
-    tma = tma_movement(40)
-    kinematic_model.setup_telescope(**tma)
+    kinematic_model = gen_kinem_model(mjd_start=mjd_start)
     observatory = ModelObservatory(nside=nside, mjd_start=mjd_start,
         sim_to_o=sim_to_o, kinem_model=kinematic_model)
     
@@ -1451,6 +1472,14 @@ def gen_scheduler(args):
     # if changing mjd_start
     mjd_start = SURVEY_START_MJD + mjd_plus
 
+    # Blob block sizes assume a typical slew time between visits.
+    # Optionally estimate it from this run's kinematic model.
+    slew_approx = 7.5
+    if args.slew_table:
+        slew_table = load_slew_table(gen_kinem_model(mjd_start=mjd_start), mjd=mjd_start)
+        slew_approx = blob_slew_approx(slew_table)
+        print("Using blob slew_approx of %.2f seconds" % slew_approx)
+
     fileroot, extra_info = set_run_info(dbroot=dbroot, file_end="v4.1_", out_dir=out_dir)
 
     pattern_dict = {
@@ -1509,6 +1538,7 @@ def gen_scheduler(args):
         night_pattern=gaps_night_pattern,
         u_exptime=u_exptime,
         nexp=nexp,
+        slew_approx=slew_approx,
     )
 
     # Set up the DDF surveys to dither
@@ -1551,6 +1581,7 @@ def gen_scheduler(args):
         footprints=footprints,
         mjd_start=mjd_start,
         u_exptime=u_exptime,
+        slew_approx=slew_approx,
     )
     twi_blobs = generate_twi_blobs(
         nside,
@@ -1559,6 +1590,7 @@ def gen_scheduler(args):
         wfd_footprint=wfd_footprint,
         repeat_night_weight=repeat_night_weight,
         night_pattern=reverse_ei_night_pattern,
+        slew_approx=slew_approx,
     )
 
     roman_surveys = [
@@ -1651,6 +1683,13 @@ def sched_argparser():
     parser.set_defaults(split_long=False)
     parser.add_argument("--no_too", dest="no_too", action="store_true")
     parser.set_defaults(no_too=False)
+    parser.add_argument(
+        "--slew_table",
+        dest="slew_table",
+        action="store_true",
+        help="Set blob slew_approx from a cached slew time table of the kinematic model",
+    )
+    parser.set_defaults(slew_table=False)
 
     return parser
 
@@ -0,0 +1,207 @@
+# Run a grid of TMA kinematic settings in parallel, sharing a single
+# scheduler construction. Each TMA quantity is set as a percent of
+# nominal performance, as in `tma_movement`, so e.g. tma_70-40.py is
+# the point --az_speed 70 --alt_speed 70 --az_accel 40 --alt_accel 40
+# --az_jerk 40 --alt_jerk 40.
+
+__all__ = ("hybrid_tma", "tma_grid", "run_point")
+
+import copy
+import itertools
+import multiprocessing
+import os
+
+import numpy as np
+import pandas as pd
+
+from rubin_scheduler.scheduler import sim_runner
+from rubin_scheduler.scheduler.model_observatory import KinemModel, ModelObservatory, tma_movement
+from rubin_scheduler.scheduler.schedulers import SimpleFilterSched
+from rubin_scheduler.scheduler.targetofo import gen_all_events
+from rubin_scheduler.utils import SURVEY_START_MJD
+
+from tma_70 import TOO_SCALE, gen_scheduler, sched_argparser, set_run_info
+
+# Nominal settle time, scaled by the settle percent
+SETTLE_TIME = 3.0
+
+# Command line option for each percent and the tma keys it sets
+SWEEP_KEYS = {
+    "az_speed": ["azimuth_maxspeed"],
+    "az_accel": ["azimuth_accel"],
+    "az_jerk": ["azimuth_jerk"],
+    "alt_speed": ["altitude_maxspeed"],
+    "alt_accel": ["altitude_accel"],
+    "alt_jerk": ["altitude_jerk"],
+}
+
+# Set in the parent before the pool forks, so workers start from
+# the same pristine objects without re-building them.
+_SHARED = {}
+
+
+def hybrid_tma(az_speed=70, az_accel=70, az_jerk=70, alt_speed=70, alt_accel=70, alt_jerk=70, settle=100):
+    """Build a tma dict with each quantity at its own percent
+
+    Parameters
+    ----------
+    az_speed, az_accel, az_jerk : `float`
+        Percent of nominal azimuth max speed, acceleration and jerk.
+    alt_speed, alt_accel, alt_jerk : `float`
+        Percent of nominal altitude max speed, acceleration and jerk.
+    settle : `float`
+        Percent of the nominal 3 second settle time. Default 100.
+
+    Returns
+    -------
+    tma : `dict`
+        Can be passed as kwargs to `KinemModel.setup_telescope`.
+    """
+    percents = {
+        "az_speed": az_speed,
+        "az_accel": az_accel,
+        "az_jerk": az_jerk,
+        "alt_speed": alt_speed,
+        "alt_accel": alt_accel,
+        "alt_jerk": alt_jerk,
+    }
+    tma = {}
+    for name, keys in SWEEP_KEYS.items():
+        movement = tma_movement(percents[name])
+        for key in keys:
+            tma[key] = movement[key]
+    tma["settle_time"] = SETTLE_TIME * settle / 100.0
+    return tma
+
+
+def tma_grid(args):
+    """Expand the command line percents into a list of sweep points
+
+    Returns
+    -------
+    points : `list` [`dict`]
+        One dict of percents (kwargs for `hybrid_tma`) per grid point.
+    """
+    names = list(SWEEP_KEYS.keys()) + ["settle"]
+    points = []
+    for values in itertools.product(*[getattr(args, name) for name in names]):
+        points.append(dict(zip(names, values)))
+    return points
+
+
+def point_label(point):
+    """Short string label for a sweep point"""
+    return "_".join(["%s%g" % (key, val) for key, val in point.items()])
+
+
+def run_point(point):
+    """Simulate one point of the sweep
+
+    Parameters
+    ----------
+    point : `dict`
+        Percents for `hybrid_tma`.
+
+    Returns
+    -------
+    summary : `dict`
+        The point percents, number of visits and mean slew time.
+    """
+    args = _SHARED["args"]
+    scheduler = copy.deepcopy(_SHARED["scheduler"])
+    sim_to_o = copy.deepcopy(_SHARED["sim_to_o"])
+    mjd_start = _SHARED["mjd_start"]
+
+    kinematic_model = KinemModel(mjd0=mjd_start)
+    kinematic_model.setup_telescope(**hybrid_tma(**point))
+    observatory = ModelObservatory(
+        nside=args.nside, mjd_start=mjd_start, sim_to_o=sim_to_o, kinem_model=kinematic_model
+    )
+
+    filename = None
+    if args.save_dbs:
+        years = np.round(args.survey_length / 365.25)
+        filename = _SHARED["fileroot"] + point_label(point) + "_%iyrs.db" % years
+
+    observatory, scheduler, observations = sim_runner(
+        observatory,
+        scheduler,
+        sim_duration=args.survey_length,
+        filename=filename,
+        delete_past=True,
+        verbose=args.verbose,
+        extra_info=_SHARED["extra_info"],
+        filter_scheduler=SimpleFilterSched(illum_limit=40.0),
+        event_table=_SHARED["event_table"],
+    )
+
+    summary = dict(point)
+    summary["n_visits"] = observations.size
+    summary["mean_slewtime"] = np.mean(observations["slewtime"]) if observations.size > 0 else np.nan
+    return summary
+
+
+def sweep_argparser():
+    parser = sched_argparser()
+    for name in SWEEP_KEYS:
+        axis, quantity = name.split("_")
+        parser.add_argument(
+            "--" + name,
+            type=float,
+            nargs="+",
+            default=[70.0],
+            help="Percent(s) of nominal %s %s" % ({"az": "azimuth", "alt": "altitude"}[axis], quantity),
+        )
+    parser.add_argument(
+        "--settle", type=float, nargs="+", default=[100.0], help="Percent(s) of the nominal 3s settle time"
+    )
+    parser.add_argument("--n_proc", type=int, default=None, help="Number of processes. Default all cores")
+    parser.add_argument(
+        "--save_dbs",
+        dest="save_dbs",
+        action="store_true",
+        help="Write an opsim database for every point, not just the summary",
+    )
+    parser.set_defaults(save_dbs=False)
+    parser.add_argument("--summary_file", type=str, default="tma_sweep_summary.csv")
+    return parser
+
+
+if __name__ == "__main__":
+    parser = sweep_argparser()
+    args = parser.parse_args()
+
+    points = tma_grid(args)
+    mjd_start = SURVEY_START_MJD + args.mjd_plus
+
+    # Build the scheduler once. The TMA settings only enter through the
+    # model observatory. Note the blob slew_approx (if --slew_table)
+    # comes from the default tma_70 kinematic model.
+    setup_args = copy.copy(args)
+    setup_args.setup_only = True
+    events = (None, None)
+    if not args.no_too:
+        # Generated once, for the scheduler's ToO surveys and the runs
+        events = gen_all_events(scale=TOO_SCALE, nside=args.nside)
+    _SHARED["scheduler"] = gen_scheduler(setup_args, events=events)
+    _SHARED["sim_to_o"], _SHARED["event_table"] = events
+    dbroot = "tma_sweep" if args.dbroot is None else args.dbroot
+    _SHARED["fileroot"], _SHARED["extra_info"] = set_run_info(
+        dbroot=dbroot, file_end="v4.1_", out_dir=args.out_dir
+    )
+    _SHARED["args"] = args
+    _SHARED["mjd_start"] = mjd_start
+
+    n_proc = args.n_proc
+    if n_proc is None:
+        n_proc = os.cpu_count()
+    n_proc = np.min([n_proc, len(points)])
+    print("Running %i TMA settings on %i processes" % (len(points), n_proc))
+
+    # Fork, so workers inherit the constructed scheduler
+    with multiprocessing.get_context("fork").Pool(n_proc) as pool:
+        summaries = pool.map(run_point, points, chunksize=1)
+
+    summary = pd.DataFrame(summaries)
+    summary.to_csv(os.path.join(args.out_dir, args.summary_file), index=False)
+    print(summary.to_string(index=False))
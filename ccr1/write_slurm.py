@@ -1,7 +1,129 @@
 # python script to write all the added parameters to a pbs script, which can then be executed on athena0
+#
+# With --array, each line of the commandfile is treated as an independent
+# run and the script is written as a slurm array job, with --pack runs
+# per array task. Memory can be sized from a peak RSS profile
+# (written by --record_rss, e.g. from a short version of the sweep)
+# rather than a flat 20 GB per task.
 
-import os
 import argparse
+import os
+import shlex
+
+# Memory to assume for a run with no entry in the peak RSS profile
+DEFAULT_MEM_GB = 20
+# First words of commandfile lines that are not runs
+SHELL_CONTROL = ("wait", "cd", "export", "source", "set", "module", "conda", "echo")
+
+
+def read_commands(commandfile):
+    """Read one command per line, skipping blank lines and comments"""
+    with open(commandfile, "r") as f:
+        lines = f.readlines()
+    commands = [line.strip() for line in lines]
+    commands = [line for line in commands if (len(line) > 0) & (not line.startswith("#"))]
+    return commands
+
+
+def read_rss_profile(filename):
+    """Read a peak RSS profile
+
+    Each line is the peak resident set size in kB (as reported by
+    GNU time's %M) followed by the command that was run. Where a
+    command appears more than once, the largest peak is kept.
+
+    Returns
+    -------
+    profile : `dict`
+        Peak memory (GB) keyed by command.
+    """
+    profile = {}
+    with open(filename, "r") as f:
+        for line in f:
+            line = line.strip()
+            if len(line) == 0:
+                continue
+            peak_kb, command = line.split(maxsplit=1)
+            peak_gb = float(peak_kb) / 1024.0**2
+            profile[command] = max(profile.get(command, 0.0), peak_gb)
+    return profile
+
+
+def pack_commands(commands, pack):
+    """Split commands into groups of `pack` for each array task"""
+    return [commands[i : i + pack] for i in range(0, len(commands), pack)]
+
+
+def task_memory(group, ntasks, profile=None, headroom=1.25):
+    """Memory (GB) needed to run a group of commands ntasks at a time
+
+    Commands run in batches of ntasks, so the requirement is the
+    largest batch total, with some headroom for run-to-run variation.
+    """
+    if profile is None:
+        profile = {}
+    mem = 0
+    for i in range(0, len(group), ntasks):
+        batch = group[i : i + ntasks]
+        batch_mem = sum([profile.get(command, DEFAULT_MEM_GB / headroom) for command in batch])
+        mem = max(mem, batch_mem)
+    return int(-(-mem * headroom // 1))
+
+
+def run_command(line):
+    """The command of a commandfile line, without a trailing &
+
+    Returns None for shell control lines (wait, cd, export, ...) and
+    compound lines (&&, ||, ;, |), which are not single runs to size
+    or time.
+    """
+    command = line.strip()
+    if command.endswith("&") and not command.endswith("&&"):
+        command = command[:-1].rstrip()
+    words = command.split()
+    if len(words) == 0 or words[0] in SHELL_CONTROL:
+        return None
+    if any([operator in command for operator in ("&&", "||", ";", "|")]):
+        return None
+    return command
+
+
+def timed_command(command, record_rss):
+    """command, run under GNU time appending its peak RSS to record_rss"""
+    # GNU time expands % directives and backslash escapes in its
+    # format, escape both so the command is logged as is
+    log_format = "%M " + command.replace("\\", "\\\\").replace("%", "%%")
+    return "/usr/bin/time -a -o %s -f %s %s" % (shlex.quote(record_rss), shlex.quote(log_format), command)
+
+
+def write_command_group(outfile, group, ntasks, record_rss=None, indent=""):
+    """Write a group of commands, running up to ntasks at once"""
+    for i in range(0, len(group), ntasks):
+        batch = group[i : i + ntasks]
+        for command in batch:
+            if record_rss is not None:
+                command = timed_command(command, record_rss)
+            if len(batch) > 1:
+                command += " &"
+            outfile.write(f"{indent}{command}\n")
+        if len(batch) > 1:
+            outfile.write(f"{indent}wait\n")
+
+
+def write_commandfile(outfile, lines, record_rss=None):
+    """Write a commandfile as it is, timing each run if record_rss is set
+
+    The commandfile keeps its own & and wait lines; shell control and
+    compound lines are written untimed.
+    """
+    for line in lines:
+        command = run_command(line) if record_rss is not None else None
+        if command is None or line.lstrip().startswith("#"):
+            outfile.write(line)
+            continue
+        background = " &" if line.rstrip().endswith("&") else ""
+        outfile.write(f"{timed_command(command, record_rss)}{background}\n")
+
 
 if __name__ == "__main__":
 
@@ -51,15 +173,75 @@ if __name__ == "__main__":
         help="use content of commandfile as executable",
         default=None,
     )
+    parser.add_argument(
+        "--array",
+        dest="array",
+        action="store_true",
+        help="write an array job, treating each line of commandfile as a separate run",
+    )
+    parser.set_defaults(array=False)
+    parser.add_argument(
+        "--pack",
+        type=int,
+        default=1,
+        help="number of commandfile runs per array task (run ntasks at a time)",
+    )
+    parser.add_argument(
+        "--max_running",
+        type=int,
+        default=None,
+        help="limit on simultaneously running array tasks",
+    )
+    parser.add_argument(
+        "--rss_profile",
+        type=str,
+        default=None,
+        help="peak RSS profile (kB command, per line) used to size --mem",
+    )
+    parser.add_argument(
+        "--headroom", type=float, default=1.25, help="memory multiplier on profiled peak RSS"
+    )
+    parser.add_argument(
+        "--record_rss",
+        type=str,
+        default=None,
+        help="append peak RSS of each command to this file (for a later --rss_profile)",
+    )
+    parser.add_argument("--env", type=str, default="rubin-sim", help="conda environment to activate")
     args = parser.parse_args()
 
     if args.commandfile is not None and args.command is not None:
         args.command = None
         print("Using --commandfile instead of --command")
 
+    if args.array and args.commandfile is None:
+        raise ValueError("--array needs a --commandfile with one run per line")
+
     if args.dir is None:
         args.dir = os.getcwd()
 
+    profile = None
+    if args.rss_profile is not None:
+        profile = read_rss_profile(args.rss_profile)
+
+    groups = None
+    if args.array:
+        commands = read_commands(args.commandfile)
+        for command in commands:
+            if run_command(command) != command:
+                raise ValueError("--array runs each line on its own, %s is not a single command" % command)
+        groups = pack_commands(commands, args.pack)
+        # Every array task gets the same request, so size for the largest
+        mem = max([task_memory(group, args.ntasks, profile=profile, headroom=args.headroom) for group in groups])
+    elif profile is not None and args.commandfile is not None:
+        commands = [run_command(line) for line in read_commands(args.commandfile)]
+        commands = [command for command in commands if command is not None]
+        mem = task_memory(commands, args.ntasks, profile=profile, headroom=args.headroom)
+    elif profile is not None and args.command is not None:
+        mem = task_memory([args.command], args.ntasks, profile=profile, headroom=args.headroom)
+    else:
+        mem = args.ntasks * DEFAULT_MEM_GB
+
     with open(args.outfile, "w") as outfile:
 
         outfile.write("#!/bin/bash\n")
@@ -77,8 +259,17 @@ if __name__ == "__main__":
             jobname = args.jobname
             slurm_outputs = jobname
         outfile.write(f"#SBATCH --job-name={jobname}\n")
-        outfile.write(f"#SBATCH --output={slurm_outputs}-out-%j.txt\n")
-        outfile.write(f"#SBATCH --error={slurm_outputs}-err-%j.txt\n")
+        if args.array:
+            # One log per array task
+            outfile.write(f"#SBATCH --output={slurm_outputs}-out-%A_%a.txt\n")
+            outfile.write(f"#SBATCH --error={slurm_outputs}-err-%A_%a.txt\n")
+            array = f"0-{len(groups) - 1}"
+            if args.max_running is not None:
+                array += f"%{args.max_running}"
+            outfile.write(f"#SBATCH --array={array}\n")
+        else:
+            outfile.write(f"#SBATCH --output={slurm_outputs}-out-%j.txt\n")
+            outfile.write(f"#SBATCH --error={slurm_outputs}-err-%j.txt\n")
 
         if args.email is not None:
             outfile.write("#SBATCH --mail-type=ALL\n")
@@ -88,7 +279,6 @@ if __name__ == "__main__":
         # The number of nodes/tasks should be job dependent
         outfile.write("#SBATCH --nodes=1\n")
         outfile.write(f"#SBATCH --ntasks={args.ntasks}\n")
-        mem = args.ntasks * 20
         outfile.write(f"#SBATCH --mem={mem}g\n")
         outfile.write(f"#SBATCH --cpus-per-task=1\n")
         outfile.write(f"#SBATCH --chdir={args.dir}\n")
@@ -101,18 +291,25 @@ if __name__ == "__main__":
 
         # Assume we're running in rubin-sim conda
         outfile.write("source ~/.bashrc\n")
-        outfile.write("conda activate rubin-sim\n")
+        outfile.write(f"conda activate {args.env}\n")
         outfile.write("export OPENBLAS_NUM_THREADS=1\n")
         outfile.write("\n")
 
         # Now copy in command or commandfile
-        if args.command is not None:
-            outfile.write(args.command)
-            outfile.write("\n")
+        if args.array:
+            outfile.write("case $SLURM_ARRAY_TASK_ID in\n")
+            for i, group in enumerate(groups):
+                outfile.write(f"    {i})\n")
+                write_command_group(outfile, group, args.ntasks, record_rss=args.record_rss, indent="        ")
+                outfile.write("        ;;\n")
+            outfile.write("esac\n")
+
+        elif args.command is not None:
+            write_command_group(outfile, [args.command], 1, record_rss=args.record_rss)
 
         else:
             with open(args.commandfile, "r") as f:
-                lines = f.read()
-            outfile.write(lines)
+                lines = f.readlines()
+            write_commandfile(outfile, lines, record_rss=args.record_rss)
 
         outfile.write("echo Job ending at `date`\n")
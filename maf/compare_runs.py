@@ -0,0 +1,310 @@
+# Compare MAF summary statistics across many runs, normalized to a
+# baseline, without re-running quick_look.ipynb. The metric subset of
+# summary.h5 and each normalized table are cached on disk, so repeat
+# comparisons only read small npz files.
+
+__all__ = ("norm_df", "load_summary", "compare_runs")
+
+import argparse
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+
+# Metric names in summary.h5 and the short names used in comparison tables
+NAME_DICT = {
+    "FootprintFraction N year 1 u and night < 365 HealpixSlicer": "Y1,u",
+    "FootprintFraction N year 1 g and night < 365 HealpixSlicer": "Y1,g",
+    "FootprintFraction N year 1 r and night < 365 HealpixSlicer": "Y1,r",
+    "FootprintFraction N year 1 i and night < 365 HealpixSlicer": "Y1,i",
+    "best18k Parallax fiveSigmaDepth, filter, seeingFwhmGeom, ra_pi_amp, dec_pi_amp HealpixSlicer": "parallax best 18k",
+    "best18k properMotion HealpixSlicer": "proper motion best 18k",
+    "Fraction detected of total (mean) MicrolensingMetric_detect tE 20_30 days UserPointsSlicer": "20-30d microlensing\ndetection",
+    "Fraction detected of total (mean) MicrolensingMetric_detect tE 60_90 days UserPointsSlicer": "60-90d microlensing\ndetection",
+    "fONv MedianNvis fO HealpixSlicer": "fO N vis",
+    "Total detected SNNSNMetric_reducen_sn DDF excluded HealpixSlicer": "SNe, N",
+    "Median SNNSNMetric_reducezlim DDF excluded HealpixSlicer": "SNe, zlim",
+    "3x2ptFoM Exgalm5WithCuts i band non-DD year 10 HealpixSlicer": "3x2 i-band",
+    "Median WeakLensingNvisits gri band non-DD HealpixSlicer": "WL Nvis \ni-band",
+    "Sum ColorSlope visitExposureTime > 19 HealpixSlicer": "color slope",
+    "Sum ColorSlope2Night visitExposureTime > 19 HealpixSlicer": "2day\ncolor slope",
+    "Total detected XRBPopMetric_early_detect UserPointsSlicer": "XRB\nearly detect",
+    "VolumeSum Brown Dwarf, L7 HealpixSlicer": "Brown Dwarf Vol",
+    "CumulativeCompleteness H <= 16.000000 DiscoveryNChances NEO 3 pairs in 15 nights SNR=3 detection loss MoObjSlicer": "NEO bright",
+    "CumulativeCompleteness H <= 22.000000 DiscoveryNChances NEO 3 pairs in 15 nights SNR=3 detection loss MoObjSlicer": "NEO faint",
+    "CumulativeCompleteness H <= 6.000000 DiscoveryNChances TNO 3 pairs in 15 nights SNR=3 detection loss MoObjSlicer": "TNO",
+    "CumulativeCompleteness H <= 20.000000 DiscoveryNChances MBA 3 pairs in 15 nights SNR=3 detection loss MoObjSlicer": "MBA",
+    "CumulativeCompleteness H <= 18.000000 DiscoveryNChances Trojan 3 pairs in 15 nights SNR=3 detection loss MoObjSlicer": "Trojan",
+    "CumulativeCompleteness H <= 16.000000 DiscoveryNChances Vatira 1 quad in 1 night detection loss MoObjSlicer": "Vatira",
+    "CumulativeCompleteness H <= 20.000000 DiscoveryNChances PHA 1 quad in 1 night detection loss MoObjSlicer": "PHA, quad",
+}
+
+MAG_DICT = {
+    "Median CoaddM5 g HealpixSlicer": "g",
+    "Median CoaddM5 i HealpixSlicer": "i",
+    "Median CoaddM5 r HealpixSlicer": "r",
+    "Median CoaddM5 u HealpixSlicer": "u",
+    "Median CoaddM5 y HealpixSlicer": "y",
+    "Median CoaddM5 z HealpixSlicer": "z",
+}
+
+DDF_DICT = {
+    "Sum SNNSNMetric DD:COSMOS_reducen_sn DD:COSMOS all bands, only DDF observations HealpixSubsetSlicer": "N SN COSMOS",
+    "Sum SNNSNMetric DD:ECDFS_reducen_sn DD:ECDFS all bands, only DDF observations HealpixSubsetSlicer": "N SN ECDFS",
+    "Sum SNNSNMetric DD:EDFS_reducen_sn DD:EDFS all bands, only DDF observations HealpixSubsetSlicer": "N SN EDFS",
+    "Sum SNNSNMetric DD:ELAISS1_reducen_sn DD:ELAISS1 all bands, only DDF observations HealpixSubsetSlicer": "N SN ELAISS1",
+    "Sum SNNSNMetric DD:XMM_LSS_reducen_sn DD:XMM_LSS all bands, only DDF observations HealpixSubsetSlicer": "N SN XMM_LSS",
+    "Median SNNSNMetric DD:COSMOS_reducezlim DD:COSMOS all bands, only DDF observations HealpixSubsetSlicer": "zlim COSMOS",
+    "Median SNNSNMetric DD:ECDFS_reducezlim DD:ECDFS all bands, only DDF observations HealpixSubsetSlicer": "zlim ECDFS",
+    "Median SNNSNMetric DD:EDFS_reducezlim DD:EDFS all bands, only DDF observations HealpixSubsetSlicer": "zlim EDFS",
+    "Median SNNSNMetric DD:ELAISS1_reducezlim DD:ELAISS1 all bands, only DDF observations HealpixSubsetSlicer": "zlim ELAISS1",
+    "Median SNNSNMetric DD:XMM_LSS_reducezlim DD:XMM_LSS all bands, only DDF observations HealpixSubsetSlicer": "zlim XMM_LSS",
+    "Total detected KNePopMetric_DD:COSMOS_ztfrest_simple DD:COSMOS UserPointsSlicer": "Kne COSMOS",
+    "Total detected KNePopMetric_DD:ECDFS_ztfrest_simple DD:ECDFS UserPointsSlicer": "Kne ECDFS",
+    "Total detected KNePopMetric_DD:EDFS_ztfrest_simple DD:EDFS UserPointsSlicer": "Kne EDFS",
+    "Total detected KNePopMetric_DD:ELAISS1_ztfrest_simple DD:ELAISS1 UserPointsSlicer": "Kne ELAISS1",
+    "Total detected KNePopMetric_DD:WFD_ztfrest_simple DD:WFD UserPointsSlicer": "Kne WFD",
+    "Total detected KNePopMetric_DD:XMM_LSS_ztfrest_simple DD:XMM_LSS UserPointsSlicer": "Kne XMM_LSS",
+    "Median DD:COSMOS NVisits all bands HealpixSubsetSlicer": "N COSMOS",
+    "Median DD:ECDFS NVisits all bands HealpixSubsetSlicer": "N ECDFS",
+    "Median DD:EDFS NVisits all bands HealpixSubsetSlicer": "N EDFS",
+    "Median DD:ELAISS1 NVisits all bands HealpixSubsetSlicer": "N ELAISS1",
+    "Median DD:WFD NVisits all bands HealpixSubsetSlicer": "N WFD",
+    "Median DD:XMM_LSS NVisits all bands HealpixSubsetSlicer": "N XMM_LSS",
+}
+
+GAPS_DICT = {}
+for filtername in "ugrizy":
+    for times in [3, 7, 24]:
+        GAPS_DICT[
+            "Mean N gaps in %s at %ihr in top 18k Gaps_%ihr %s band HealpixSlicer" % (filtername, times, times, filtername)
+        ] = "gaps %s %i" % (filtername, times)
+
+# Columns that are uncertainties, better when smaller
+INVERT_COLS = [
+    "parallax best 18k",
+    "proper motion best 18k",
+]
+# Columns that are mags or fractions, compared by difference rather than fractional difference
+MAG_COLS = [
+    "20-30d microlensing\ndetection",
+    "60-90d microlensing\ndetection",
+    "SNe, zlim",
+    "NEO bright",
+    "NEO faint",
+    "TNO",
+    "Vatira",
+    "MBA",
+    "Trojan",
+    "u",
+    "g",
+    "r",
+    "i",
+    "z",
+    "y",
+]
+
+TABLES = {"science": NAME_DICT, "mag": MAG_DICT, "ddf": DDF_DICT, "gaps": GAPS_DICT}
+
+
+def norm_df(
+    df,
+    runs,
+    cols,
+    norm_run="baseline",
+    invert_cols=None,
+    reverse_cols=None,
+    run_label="run_name",
+    mag_cols=[],
+):
+    """
+    Normalize values in a dataframe to a given run
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        The input data frame
+    runs : list of str
+        A list of run numes
+    cols : list of str
+        A list of columns in df to use
+    norm_run : str
+        The row to use to normalize things to
+    invert_cols : list of str
+        A list of column names that should be inverted (e.g., columns that
+        are uncertainties and are better with a smaller value)
+    reverse_cols : list of str
+        Columns to reverse (e.g., magnitudes)
+    run_label : str (run_name)
+        The column that has run names
+    mag_cols : list of str
+        Columns that are in magnitudes
+    """
+    # Last row with each run name, as in the quick_look version
+    row_of = {name: i for i, name in enumerate(df.index)}
+    indices = [row_of[name] for name in runs]
+    cols = [col for col in cols if col != run_label]
+    values = df[cols].to_numpy(dtype=float)[indices]
+
+    if reverse_cols is not None:
+        reverse = np.isin(cols, reverse_cols)
+        values[:, reverse] = -values[:, reverse]
+    if invert_cols is not None:
+        invert = np.isin(cols, invert_cols)
+        values[:, invert] = 1.0 / values[:, invert]
+    if norm_run is not None:
+        ref = values[np.max(np.where(np.array(runs) == norm_run)[0])]
+        if isinstance(mag_cols, str) and mag_cols == "all":
+            is_mag = np.ones(len(cols), dtype=bool)
+        else:
+            is_mag = np.isin(cols, mag_cols)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            values = np.where(is_mag, 1.0 + (values - ref), 1.0 + (values - ref) / ref)
+
+    return pd.DataFrame(values, index=df.index[indices], columns=cols)
+
+
+def _file_key(filename):
+    stat = os.stat(filename)
+    return "%s %i %i" % (os.path.abspath(filename), stat.st_mtime_ns, stat.st_size)
+
+
+def _hash(*items):
+    return hashlib.sha1(repr(items).encode()).hexdigest()[0:16]
+
+
+def _save_frame(filename, df):
+    temp_name = filename + ".%i.tmp.npz" % os.getpid()
+    np.savez(
+        temp_name,
+        values=df.to_numpy(dtype=float),
+        runs=np.array(df.index, dtype=str),
+        cols=np.array(df.columns, dtype=str),
+    )
+    os.replace(temp_name, filename)
+
+
+def _load_frame(filename):
+    with np.load(filename) as data:
+        return pd.DataFrame(data["values"], index=data["runs"], columns=data["cols"])
+
+
+def load_summary(filename="summary.h5", table="science", cache_dir=".compare_cache"):
+    """Load one metric table (short column names) from a summary file
+
+    Parameters
+    ----------
+    filename : `str`
+        MAF summary file (hdf5, or csv).
+    table : `str`
+        Which set of metrics, one of "science", "mag", "ddf", "gaps".
+    cache_dir : `str`
+        Directory for cached tables. None to not cache.
+
+    Returns
+    -------
+    data : `pd.DataFrame`
+        Metric values, one row per run. Metrics missing from the
+        summary file are NaN.
+    """
+    name_dict = TABLES[table]
+    cache_name = None
+    if cache_dir is not None:
+        cache_name = os.path.join(cache_dir, "summary_%s.npz" % _hash(_file_key(filename), name_dict))
+        if os.path.isfile(cache_name):
+            return _load_frame(cache_name)
+
+    if filename.endswith(".csv"):
+        data_loaded = pd.read_csv(filename, index_col=0)
+    else:
+        data_loaded = pd.read_hdf(filename)
+    data = data_loaded.reindex(columns=list(name_dict.keys()))
+    data.columns = list(name_dict.values())
+
+    if cache_name is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        _save_frame(cache_name, data)
+    return data
+
+
+def compare_runs(
+    runs,
+    norm_run,
+    filename="summary.h5",
+    table="science",
+    cache_dir=".compare_cache",
+):
+    """Metrics for runs, normalized to norm_run
+
+    Parameters
+    ----------
+    runs : `list` [`str`]
+        Runs to compare. norm_run is added if not included.
+    norm_run : `str`
+        Run to normalize to.
+    filename : `str`
+        MAF summary file.
+    table : `str`
+        Which set of metrics, one of "science", "mag", "ddf", "gaps".
+    cache_dir : `str`
+        Directory for cached tables. None to not cache.
+
+    Returns
+    -------
+    ndata : `pd.DataFrame`
+        Normalized metrics, one row per run. 1 is the same as
+        norm_run, larger is better.
+    """
+    runs = list(runs)
+    if norm_run not in runs:
+        runs = [norm_run] + runs
+    cache_name = None
+    if cache_dir is not None:
+        key = _hash(_file_key(filename), TABLES[table], runs, norm_run, INVERT_COLS, MAG_COLS)
+        cache_name = os.path.join(cache_dir, "norm_%s.npz" % key)
+        if os.path.isfile(cache_name):
+            return _load_frame(cache_name)
+
+    data = load_summary(filename=filename, table=table, cache_dir=cache_dir)
+    ndata = norm_df(
+        data,
+        runs,
+        cols=data.columns.values.tolist(),
+        invert_cols=INVERT_COLS,
+        mag_cols=MAG_COLS,
+        norm_run=norm_run,
+    )
+    if cache_name is not None:
+        _save_frame(cache_name, ndata)
+    return ndata
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare MAF summary metrics to a baseline run")
+    parser.add_argument("--summary", type=str, default="summary.h5", help="MAF summary file")
+    parser.add_argument("--baseline", type=str, default="baseline_v4.1_10yrs", help="Run to normalize to")
+    parser.add_argument("--runs", type=str, nargs="*", default=[], help="Runs to compare")
+    parser.add_argument(
+        "--match", type=str, default=None, help="Also compare all runs with this in their name (e.g., 4.1)"
+    )
+    parser.add_argument("--exclude", type=str, nargs="*", default=["selfcal"], help="Skip --match runs with these")
+    parser.add_argument("--table", type=str, default="science", choices=list(TABLES.keys()))
+    parser.add_argument("--cache_dir", type=str, default=".compare_cache")
+    parser.add_argument("--outfile", type=str, default=None, help="Also write the table to this csv")
+    args = parser.parse_args()
+
+    runs = list(args.runs)
+    if args.match is not None:
+        all_runs = load_summary(filename=args.summary, table=args.table, cache_dir=args.cache_dir).index
+        runs += [
+            run
+            for run in dict.fromkeys(all_runs)
+            if (args.match in run) & (run not in runs) & (not any([skip in run for skip in args.exclude]))
+        ]
+
+    ndata = compare_runs(runs, args.baseline, filename=args.summary, table=args.table, cache_dir=args.cache_dir)
+    ndata.columns = [col.replace("\n", " ") for col in ndata.columns]
+    with pd.option_context("display.max_rows", None, "display.max_columns", None, "display.width", 250):
+        print(ndata.round(3))
+    if args.outfile is not None:
+        ndata.to_csv(args.outfile)
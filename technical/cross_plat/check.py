@@ -1,13 +1,32 @@
+import argparse
+import os
+
 import numpy as np
-from rubin_scheduler.scheduler.utils import restore_scheduler
 from rubin_scheduler.scheduler.model_observatory import ModelObservatory
 from cross import example_scheduler
+from fast_restore import fast_restore_scheduler
+from snapshot import load_snapshot, save_snapshot
 
 
 if __name__ == "__main__":
-    sched = example_scheduler()
-    observatory = ModelObservatory()
-    sched, obs = restore_scheduler(439, sched, observatory, 'cross_v4.1_0yrs.db')
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--snapshot",
+        type=str,
+        default=None,
+        help="Load the restored state from this snapshot if it exists, else restore and save it there. "
+        "Not checked against the db, cross.py or rubin_scheduler version, delete it when they change",
+    )
+    args = parser.parse_args()
+
+    if args.snapshot is not None and os.path.isfile(args.snapshot):
+        sched, obs = load_snapshot(args.snapshot)
+    else:
+        sched = example_scheduler()
+        observatory = ModelObservatory()
+        sched, obs = fast_restore_scheduler(439, sched, observatory, 'cross_v4.1_0yrs.db')
+        if args.snapshot is not None:
+            save_snapshot((sched, obs), args.snapshot)
     conditions = obs.return_conditions()
     rewards = []
     for sur in sched.survey_lists[4]:
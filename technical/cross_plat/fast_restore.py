@@ -0,0 +1,82 @@
+# Restore a scheduler to its state after a given observation, reading
+# only the observations up to that point rather than the whole run.
+
+__all__ = ("load_observations", "fast_restore_scheduler")
+
+import sqlite3
+
+import pandas as pd
+
+from rubin_scheduler.scheduler.utils import SchemaConverter, restore_scheduler
+
+# String columns stored as categoricals in parquet output
+CATEGORICAL_COLUMNS = ["scheduler_note", "target_name"]
+
+
+def load_observations(filename, observation_id=None):
+    """Load the observations of a run up to (and including) an ID
+
+    Parameters
+    ----------
+    filename : `str`
+        Sqlite database written by sim_runner, or a parquet file of
+        the same columns (see baseline/obs_io.py).
+    observation_id : `int`
+        Last observationId to load. Default None loads all.
+
+    Returns
+    -------
+    observations : `rubin_scheduler.scheduler.utils.ObservationArray`
+    """
+    if filename.endswith(".parquet"):
+        import pyarrow.parquet as pq
+
+        filters = None
+        if observation_id is not None:
+            filters = [("observationId", "<=", observation_id)]
+        df = pq.read_table(filename, filters=filters).to_pandas()
+        for name in CATEGORICAL_COLUMNS:
+            if name in df.columns:
+                df[name] = df[name].astype(str)
+    else:
+        con = sqlite3.connect(filename)
+        if observation_id is None:
+            df = pd.read_sql("select * from observations;", con)
+        else:
+            df = pd.read_sql(
+                "select * from observations where observationId <= ?;", con, params=(int(observation_id),)
+            )
+        con.close()
+    return SchemaConverter().opsimdf2obs(df)
+
+
+def fast_restore_scheduler(observation_id, scheduler, observatory, filename, filter_sched=None):
+    """`restore_scheduler`, loading only the observations it needs
+
+    restore_scheduler reads every observation of the run before
+    selecting those up to observation_id, which for a 10 year run is
+    most of the time spent. The observations are then added to all the
+    surveys at once with add_observations_array.
+
+    Parameters
+    ----------
+    observation_id : `int`
+        The ID of the last observation that should be completed.
+    scheduler : `rubin_scheduler.scheduler.schedulers.CoreScheduler`
+        Scheduler, as it was at the start of the run.
+    observatory : `rubin_scheduler.scheduler.model_observatory.ModelObservatory`
+        The observatory.
+    filename : `str`
+        Run output, sqlite or parquet.
+    filter_sched : `rubin_scheduler.scheduler.schedulers.FilterSched`
+        The filter scheduler. Default None.
+
+    Returns
+    -------
+    scheduler, observatory
+        As returned by `restore_scheduler`.
+    """
+    observations = load_observations(filename, observation_id=observation_id)
+    return restore_scheduler(
+        observation_id, scheduler, observatory, observations, filter_sched=filter_sched, fast=True
+    )
@@ -0,0 +1,178 @@
+# Evaluate every survey's reward of a restored scheduler over a grid of
+# future times, to see when (and why not) each survey would fire.
+
+__all__ = ("reward_cube", "chosen_survey")
+
+import argparse
+import copy
+import multiprocessing
+import os
+import warnings
+
+import numpy as np
+
+# Holds the scheduler and observatory for forked workers
+_SHARED = {}
+
+
+def _evaluate(indices):
+    """Rewards of every survey at the grid times indices (run in a worker)
+
+    Workers are forked, so each has its own copy-on-write copy of the
+    scheduler and observatory; computing rewards (which caches state on
+    the surveys) never touches the parent's.
+    """
+    scheduler = _SHARED["scheduler"]
+    observatory = _SHARED["observatory"]
+    surveys = [survey for surveys in scheduler.survey_lists for survey in surveys]
+    rewards = np.zeros((indices.size, len(surveys)), dtype=np.float32)
+    sun_alt = np.zeros(indices.size)
+    for i, mjd in enumerate(_SHARED["mjds"][indices]):
+        observatory.mjd = mjd
+        conditions = observatory.return_conditions()
+        scheduler.update_conditions(conditions)
+        sun_alt[i] = conditions.sun_alt
+        for j, survey in enumerate(surveys):
+            # calc_reward_function checks feasibility, returning -inf
+            # if the survey is infeasible
+            with warnings.catch_warnings():
+                # All-NaN reward maps
+                warnings.simplefilter("ignore", category=RuntimeWarning)
+                rewards[i, j] = np.nanmax(survey.calc_reward_function(conditions))
+    feasible = rewards != -np.inf
+    return indices, rewards, feasible, sun_alt
+
+
+def reward_cube(scheduler, observatory, mjds, n_proc=None):
+    """Max reward of each survey at each time
+
+    The observatory (telescope position, loaded filters) stays as it
+    is; only the time moves.
+
+    Parameters
+    ----------
+    scheduler : `rubin_scheduler.scheduler.schedulers.CoreScheduler`
+        Scheduler, e.g. restored with `fast_restore_scheduler`.
+    observatory : `rubin_scheduler.scheduler.model_observatory.ModelObservatory`
+        The observatory.
+    mjds : `np.ndarray`
+        Times to evaluate the rewards at.
+    n_proc : `int`
+        Number of processes. Default None uses one per CPU.
+
+    Returns
+    -------
+    rewards : `np.ndarray`
+        (n_mjds, n_surveys) max reward (float32), as CoreScheduler
+        computes it: -inf where the survey is infeasible, NaN if its
+        reward map is all NaN. Surveys are in `survey_lists` order.
+    feasible : `np.ndarray`
+        (n_mjds, n_surveys) True where the reward is not -inf.
+    sun_alt : `np.ndarray`
+        Sun altitude at each time (radians).
+    """
+    if n_proc is None:
+        n_proc = os.cpu_count()
+    mjds = np.asarray(mjds, dtype=float)
+    _SHARED.update({"scheduler": scheduler, "observatory": observatory, "mjds": mjds})
+    # Interleaved chunks, so night and day times are spread over workers
+    chunks = [np.arange(start, mjds.size, n_proc * 4) for start in range(min(n_proc * 4, mjds.size))]
+    if n_proc > 1:
+        with multiprocessing.get_context("fork").Pool(n_proc) as pool:
+            results = pool.map(_evaluate, chunks)
+    else:
+        # Evaluating changes survey state, work on a copy
+        _SHARED.update(copy.deepcopy({"scheduler": scheduler, "observatory": observatory}))
+        results = [_evaluate(chunk) for chunk in chunks]
+    _SHARED.clear()
+
+    n_surveys = np.sum([len(surveys) for surveys in scheduler.survey_lists])
+    rewards = np.zeros((mjds.size, n_surveys), dtype=np.float32)
+    feasible = np.zeros((mjds.size, n_surveys), dtype=bool)
+    sun_alt = np.zeros(mjds.size)
+    for indices, chunk_rewards, chunk_feasible, chunk_sun_alt in results:
+        rewards[indices] = chunk_rewards
+        feasible[indices] = chunk_feasible
+        sun_alt[indices] = chunk_sun_alt
+    return rewards, feasible, sun_alt
+
+
+def chosen_survey(rewards, tiers):
+    """Survey the scheduler would pick at each time (-1 for none)
+
+    As CoreScheduler: the highest reward (first on ties, NaN counting
+    as -inf) in the first tier with any reward above -inf.
+
+    Parameters
+    ----------
+    rewards : `np.ndarray`
+        (n_mjds, n_surveys) rewards, from `reward_cube`.
+    tiers : `np.ndarray`
+        Tier of each survey.
+    """
+    chosen = np.zeros(rewards.shape[0], dtype=int) - 1
+    rewards = np.where(np.isnan(rewards), -np.inf, rewards)
+    # Later assignments (earlier tiers) take precedence
+    for tier in np.unique(tiers)[::-1]:
+        in_tier = np.where(tiers == tier)[0]
+        tier_rewards = rewards[:, in_tier]
+        has_reward = np.max(tier_rewards, axis=1) > -np.inf
+        chosen[has_reward] = in_tier[np.argmax(tier_rewards[has_reward], axis=1)]
+    return chosen
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--snapshot", type=str, default=None, help="Scheduler snapshot (see check.py)")
+    parser.add_argument("--db", type=str, default="cross_v4.1_0yrs.db", help="Run to restore from")
+    parser.add_argument("--observation_id", type=int, default=439, help="Restore after this observation")
+    parser.add_argument("--hours", type=float, default=24.0, help="Length of the time grid (hours)")
+    parser.add_argument("--step", type=float, default=5.0, help="Time grid step (minutes)")
+    parser.add_argument("--n_proc", type=int, default=None, help="Number of processes")
+    parser.add_argument("--outfile", type=str, default="reward_cube.npz")
+    args = parser.parse_args()
+
+    if args.snapshot is not None:
+        from snapshot import load_snapshot
+
+        scheduler, observatory = load_snapshot(args.snapshot)
+    else:
+        from rubin_scheduler.scheduler.model_observatory import ModelObservatory
+
+        from cross import example_scheduler
+        from fast_restore import fast_restore_scheduler
+
+        scheduler, observatory = fast_restore_scheduler(
+            args.observation_id, example_scheduler(), ModelObservatory(), args.db
+        )
+
+    mjds = observatory.mjd + np.arange(0, args.hours * 60.0, args.step) / 60.0 / 24.0
+    rewards, feasible, sun_alt = reward_cube(scheduler, observatory, mjds, n_proc=args.n_proc)
+    tiers = np.concatenate([[ns] * len(surveys) for ns, surveys in enumerate(scheduler.survey_lists)])
+    names = np.array([str(survey.survey_name) for surveys in scheduler.survey_lists for survey in surveys])
+    chosen = chosen_survey(rewards, tiers)
+    np.savez_compressed(
+        args.outfile,
+        mjds=mjds,
+        rewards=rewards,
+        feasible=feasible,
+        sun_alt=sun_alt,
+        tiers=tiers,
+        survey_names=names,
+        chosen=chosen,
+    )
+
+    # Surveys that would never be picked over the grid
+    night = np.where(sun_alt < np.radians(-12.0))[0]
+    never = np.setdiff1d(np.arange(names.size), chosen[night])
+    print("%i times (%i at night), %i surveys" % (mjds.size, night.size, names.size))
+    for j in never:
+        print(
+            "never chosen: tier %i %s, feasible %i%% of the night, max reward %s"
+            % (
+                tiers[j],
+                names[j],
+                100 * np.mean(feasible[night, j]) if night.size > 0 else 0,
+                np.nanmax(rewards[night, j]) if np.any(rewards[night, j] > -np.inf) else "none",
+            )
+        )
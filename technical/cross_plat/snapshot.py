@@ -0,0 +1,131 @@
+# Snapshot format for scheduler state: a small pickled header holding
+# the object graph, followed by every sizeable numpy array laid out for
+# memory mapping, so loading a snapshot doesn't copy the HEALpix maps.
+
+__all__ = ("save_snapshot", "load_snapshot")
+
+import io
+import mmap
+import pickle
+import struct
+
+import numpy as np
+
+MAGIC = b"FBSSNAP1"
+# Data starts on a page boundary, arrays on cache line boundaries
+# (offsets within the file, which is mapped whole)
+PAGE = 4096
+ALIGN = 64
+
+
+def _aligned(offset, align):
+    return -(-offset // align) * align
+
+
+class _ArrayPickler(pickle.Pickler):
+    """Pickler that sets aside numpy arrays (by reference, so shared
+    arrays stay shared) to be written after the header"""
+
+    def __init__(self, file, min_bytes):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.min_bytes = min_bytes
+        self.arrays = []
+        self.array_ids = {}
+
+    def persistent_id(self, obj):
+        if type(obj) is not np.ndarray or obj.dtype.hasobject or obj.nbytes < self.min_bytes:
+            return None
+        index = self.array_ids.get(id(obj))
+        if index is None:
+            index = len(self.arrays)
+            # Holding the array keeps its id from being reused
+            self.arrays.append(obj)
+            self.array_ids[id(obj)] = index
+        return index
+
+
+class _ArrayUnpickler(pickle.Unpickler):
+    def __init__(self, file, table, buffer, data_start):
+        super().__init__(file)
+        self.table = table
+        self.buffer = buffer
+        self.data_start = data_start
+        self.loaded = {}
+
+    def persistent_load(self, index):
+        array = self.loaded.get(index)
+        if array is None:
+            offset, dtype, shape = self.table[index]
+            array = np.ndarray(shape, dtype=dtype, buffer=self.buffer, offset=self.data_start + offset)
+            self.loaded[index] = array
+        return array
+
+
+def save_snapshot(obj, filename, min_bytes=1024):
+    """Write a snapshot of obj (e.g., a scheduler and observatory)
+
+    Parameters
+    ----------
+    obj : any picklable object
+        The state to save.
+    filename : `str`
+        Output file.
+    min_bytes : `int`
+        Arrays smaller than this are pickled in the header.
+        Default 1024.
+    """
+    graph = io.BytesIO()
+    pickler = _ArrayPickler(graph, min_bytes)
+    pickler.dump(obj)
+
+    table = []
+    offset = 0
+    for array in pickler.arrays:
+        table.append((offset, array.dtype, array.shape))
+        offset = _aligned(offset + array.nbytes, ALIGN)
+    header = pickle.dumps((graph.getvalue(), table), protocol=pickle.HIGHEST_PROTOCOL)
+    data_start = _aligned(len(MAGIC) + 8 + len(header), PAGE)
+
+    with open(filename, "wb") as outfile:
+        outfile.write(MAGIC)
+        outfile.write(struct.pack("<Q", len(header)))
+        outfile.write(header)
+        for array, (array_offset, _dtype, _shape) in zip(pickler.arrays, table):
+            outfile.seek(data_start + array_offset)
+            outfile.write(np.ascontiguousarray(array).data)
+        outfile.truncate(data_start + _aligned(offset, ALIGN))
+
+
+def load_snapshot(filename, memmap=True):
+    """Load a snapshot written by `save_snapshot`
+
+    Parameters
+    ----------
+    filename : `str`
+        Snapshot file.
+    memmap : `bool`
+        Map the arrays from the file copy-on-write, so they are only
+        read when used and changes stay in memory. If False, the file
+        is read into memory. Default True.
+
+    Returns
+    -------
+    obj
+        The saved object.
+    """
+    with open(filename, "rb") as infile:
+        if infile.read(len(MAGIC)) != MAGIC:
+            raise ValueError("%s is not a scheduler snapshot" % filename)
+        (header_len,) = struct.unpack("<Q", infile.read(8))
+        graph, table = pickle.loads(infile.read(header_len))
+        data_start = _aligned(len(MAGIC) + 8 + header_len, PAGE)
+        buffer = None
+        if len(table) > 0:
+            if memmap:
+                # Map the whole file, mmap offsets must be multiples of
+                # mmap.ALLOCATIONGRANULARITY, which varies by platform
+                buffer = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_COPY)
+            else:
+                infile.seek(0)
+                buffer = bytearray(infile.read())
+    return _ArrayUnpickler(io.BytesIO(graph), table, buffer, data_start).load()